@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+
+from app.api.schemas import CandidateRequest, LoadModelRequest, ProfileRequest
+from app.core.config import settings
+from app.ml.profiling import profiler
+from app.ml.registry import UnknownModelVersion, registry
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    if not settings.admin_token:
+        raise HTTPException(status_code=403, detail="Admin API disabled. Set ADMIN_TOKEN to enable it.")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.admin_token):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Token.")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/models")
+def models_status():
+    return registry.status()
+
+
+@router.post("/models/load", status_code=202)
+def models_load(req: LoadModelRequest):
+    """Load + warm a checkpoint in the background; poll GET /admin/models for progress."""
+    try:
+        version = registry.load(
+            path=req.path,
+            version=req.version,
+            activate=req.activate,
+            candidate_pct=None if req.activate else req.traffic_pct,
+        )
+    except (RuntimeError, ValueError) as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    return {"version": version, "state": "loading"}
+
+
+@router.post("/models/{version}/activate")
+def models_activate(version: str):
+    try:
+        registry.activate(version)
+    except UnknownModelVersion as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0])) from e
+    return registry.status()
+
+
+@router.put("/models/candidate")
+def models_set_candidate(req: CandidateRequest):
+    try:
+        registry.set_candidate(req.version, req.traffic_pct)
+    except UnknownModelVersion as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0])) from e
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    return registry.status()
+
+
+@router.delete("/models/candidate")
+def models_clear_candidate():
+    registry.clear_candidate()
+    return registry.status()
+
+
+@router.delete("/models/{version}")
+def models_unload(version: str):
+    try:
+        registry.unload(version)
+    except UnknownModelVersion as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0])) from e
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+    return registry.status()
+
+
+@router.post("/profile", status_code=202)
+def profile_start(req: ProfileRequest):
+    """
+    Profile the next `requests` requests and/or `seconds` of traffic (whichever ends first).
+    Writes Chrome traces + summary.txt/summary.json under PROFILE_DIR/<capture_id>/.
+    """
+    try:
+        return profiler.start(
+            requests=req.requests,
+            seconds=req.seconds,
+            python_sampling=req.python_sampling,
+            sample_interval_ms=req.sample_interval_ms,
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e)) from e
+
+
+@router.get("/profile")
+def profile_status():
+    return profiler.status()
+
+
+@router.delete("/profile")
+def profile_stop():
+    info = profiler.stop()
+    if info is None:
+        raise HTTPException(status_code=404, detail="No capture is running.")
+    return info
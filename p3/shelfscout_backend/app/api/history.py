@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+
+from app.core.history import history_store
+
+# Upper bound on buckets per trend query (e.g. 1 week at 1-minute buckets)
+MAX_BUCKETS = 10_080
+
+
+def require_history() -> None:
+    if not history_store.enabled:
+        raise HTTPException(status_code=503, detail="History store disabled. Set HISTORY_DB_PATH to enable it.")
+
+
+router = APIRouter(prefix="/history", tags=["history"], dependencies=[Depends(require_history)])
+
+
+@router.get("/stats")
+def history_stats():
+    return history_store.stats()
+
+
+@router.get("/alerts")
+def shelves_above_threshold(
+    threshold: float = Query(0.35, ge=0.0, le=1.0, description="Minimum empty_ratio"),
+    store_id: Optional[str] = None,
+    max_age_s: Optional[float] = Query(None, gt=0.0, description="Ignore shelves not seen for this long"),
+    limit: int = Query(1000, ge=1, le=10_000),
+):
+    """Shelves whose most recent result is at or above `threshold`, emptiest first."""
+    shelves = history_store.above_threshold(threshold, store_id=store_id, max_age_s=max_age_s, limit=limit)
+    return {"threshold": threshold, "count": len(shelves), "shelves": shelves}
+
+
+@router.get("/results")
+def results_in_range(
+    start: Optional[float] = Query(None, description="Unix time, inclusive"),
+    end: Optional[float] = Query(None, description="Unix time, inclusive"),
+    store_id: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10_000),
+    newest_first: bool = False,
+):
+    """Results across all shelves (optionally one store) in a time range."""
+    return history_store.range(store_id=store_id, start=start, end=end, limit=limit, newest_first=newest_first)
+
+
+@router.get("/shelves/{store_id}/{shelf_id}")
+def shelf_history(
+    store_id: str,
+    shelf_id: str,
+    start: Optional[float] = Query(None, description="Unix time, inclusive"),
+    end: Optional[float] = Query(None, description="Unix time, inclusive"),
+    camera_id: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=10_000),
+    newest_first: bool = False,
+    include_masks: bool = Query(False, description="Include stored RLE masks (HISTORY_STORE_MASKS)"),
+):
+    return history_store.range(
+        store_id=store_id,
+        shelf_id=shelf_id,
+        start=start,
+        end=end,
+        camera_id=camera_id,
+        limit=limit,
+        include_masks=include_masks,
+        newest_first=newest_first,
+    )
+
+
+@router.get("/shelves/{store_id}/{shelf_id}/trend")
+def shelf_trend(
+    store_id: str,
+    shelf_id: str,
+    start: Optional[float] = Query(None, description="Unix time (default: end - 24h)"),
+    end: Optional[float] = Query(None, description="Unix time (default: now)"),
+    bucket_s: float = Query(3600.0, ge=1.0, description="Bucket width in seconds"),
+    window: int = Query(1, ge=1, le=1000, description="Buckets in the trailing rolling average"),
+    camera_id: Optional[str] = None,
+):
+    """Per-bucket empty_ratio/instance averages and a trailing rolling empty_ratio."""
+    end = time.time() if end is None else end
+    start = end - 86_400.0 if start is None else start
+    if end < start:
+        raise HTTPException(status_code=422, detail="end must not be before start.")
+    if (end - start) / bucket_s > MAX_BUCKETS:
+        raise HTTPException(status_code=422, detail=f"Too many buckets; keep (end - start) / bucket_s <= {MAX_BUCKETS}.")
+    return {
+        "store_id": store_id,
+        "shelf_id": shelf_id,
+        "start": start,
+        "end": end,
+        "bucket_s": bucket_s,
+        "window": window,
+        "buckets": history_store.trend(store_id, shelf_id, start, end, bucket_s, window=window, camera_id=camera_id),
+    }
@@ -1,12 +1,36 @@
 from __future__ import annotations
 
 import logging
+import signal
+import sqlite3
+import time
+from typing import Any, Dict, Optional
 
-from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi import Depends, FastAPI, File, HTTPException, Query, Request, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
 
+from app.api.admin import router as admin_router
+from app.api.history import router as history_router
+from app.api.schemas import InputSpec
+from app.core.config import settings
+from app.core.history import history_store
 from app.core.logging import setup_logging
-from app.ml.inference import predict_from_bytes
+from app.core.metrics import INFLIGHT, REQUEST_SECONDS, render_latest
+from app.core.timing import StageTimer
+from app.ml.cascade import cascade_stats
+from app.ml.inference import (
+    ALL_FIELDS,
+    DEFAULT_POSTPROCESS,
+    StreamingImageDecoder,
+    UnsupportedImage,
+    UploadTooLarge,
+    decode_image_bytes,
+    input_spec,
+    predict_from_image,
+)
+from app.ml.profiling import profiler
+from app.ml.registry import UnknownModelVersion
 
 setup_logging()
 log = logging.getLogger("app.api")
@@ -24,26 +48,177 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let browser clients read the per-stage server-side breakdown.
+    expose_headers=["Server-Timing"],
 )
 
 
+@app.middleware("http")
+async def observe_latency(request: Request, call_next):
+    t0 = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        REQUEST_SECONDS.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status),
+        ).observe(time.perf_counter() - t0)
+
+app.include_router(admin_router)
+app.include_router(history_router)
+
+
+def _profile_on_signal(signum, _frame) -> None:
+    # Runs on the main thread, which may be holding the profiler or registry lock
+    # when the signal lands: only set a flag, the next request starts the capture.
+    profiler.start_on_next_request()
+
+
+# `kill -USR2 <pid>` captures the next PROFILE_DEFAULT_REQUESTS requests.
+if hasattr(signal, "SIGUSR2"):
+    try:
+        signal.signal(signal.SIGUSR2, _profile_on_signal)
+    except ValueError:
+        # Not in the main thread (e.g. imported by a test runner worker)
+        pass
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
-@app.post("/predict")
-async def predict(
-    file: UploadFile = File(..., description="Image file (jpg/png)"),
-    include_masks: bool = False,
-):
-    if not file.content_type or not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=415, detail="Please upload an image file.")
+@app.get("/input-spec", response_model=InputSpec)
+def get_input_spec():
+    # Static for the process lifetime; clients may cache it.
+    return input_spec()
+
+
+@app.get("/metrics")
+def metrics():
+    body, content_type = render_latest()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/cascade/stats")
+def cascade_statistics():
+    return cascade_stats.snapshot()
+
+
+class PredictOptions:
+    """Query parameters shared by /predict and /predict/raw."""
+
+    def __init__(
+        self,
+        include_masks: bool = False,
+        model_version: Optional[str] = None,
+        fields: Optional[str] = Query(
+            None,
+            description="Comma-separated subset of outputs, e.g. `empty_ratio,shelf_bbox`. "
+            "Only the model heads and stages they need are run.",
+        ),
+        cascade: Optional[bool] = Query(
+            None,
+            description="Screen with a low-res pass first and skip full inference for confidently "
+            "stocked shelves (default: CASCADE_MODE).",
+        ),
+        # Post-processing overrides (defaults come from env, see .env.example)
+        ctr_thresh: Optional[float] = Query(None, ge=0.0, le=1.0),
+        nms_kernel: Optional[int] = Query(None, ge=1, le=15),
+        top_k: Optional[int] = Query(None, ge=1, le=2000),
+        sem_thresh: Optional[float] = Query(None, ge=0.0, le=1.0),
+        max_radius: Optional[float] = Query(None, gt=0.0),
+        min_pixels: Optional[int] = Query(None, ge=0),
+        # History keys: the result is recorded when HISTORY_DB_PATH is set and both ids are given
+        store_id: Optional[str] = Query(None, max_length=128),
+        shelf_id: Optional[str] = Query(None, max_length=128),
+        camera_id: str = Query("", max_length=128),
+        captured_at: Optional[float] = Query(None, description="Unix time the photo was taken (default: now)"),
+    ):
+        selected = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+        unknown = [f for f in selected or () if f not in ALL_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Unknown field(s): {', '.join(unknown)}. Valid: {', '.join(ALL_FIELDS)}",
+            )
+        if nms_kernel is not None and nms_kernel % 2 == 0:
+            raise HTTPException(status_code=422, detail="nms_kernel must be odd.")
+        if (store_id is None) != (shelf_id is None):
+            raise HTTPException(status_code=422, detail="store_id and shelf_id must be given together.")
+
+        self.include_masks = include_masks
+        self.model_version = model_version
+        self.fields = selected
+        self.cascade = cascade
+        self.store_id = store_id
+        self.shelf_id = shelf_id
+        self.camera_id = camera_id
+        self.captured_at = captured_at
+        self.params = DEFAULT_POSTPROCESS.with_overrides(
+            prob_thresh=ctr_thresh,
+            nms_kernel=nms_kernel,
+            top_k=top_k,
+            sem_thresh=sem_thresh,
+            max_radius=max_radius,
+            min_pixels=min_pixels,
+        )
 
+
+def _record_history(result: Dict[str, Any], timer: StageTimer, opts: PredictOptions) -> None:
+    masks_rle = result.pop("masks_rle", None)
+    try:
+        with timer.stage("history"):
+            result["history_id"] = history_store.record(
+                opts.store_id,
+                opts.shelf_id,
+                result,
+                camera_id=opts.camera_id,
+                ts=opts.captured_at,
+                masks_rle=masks_rle,
+            )
+    except sqlite3.Error:
+        # The prediction itself succeeded; losing one history row shouldn't fail it.
+        log.exception("Recording history failed.")
+
+
+# Outputs the history store keeps; computed for recorded requests even if `fields` omits them
+HISTORY_FIELDS = ("empty_ratio", "predicted_instances", "shelf_bbox")
+
+
+def _run_prediction(response: Response, timer: StageTimer, opts: PredictOptions, decoded) -> Dict[str, Any]:
+    record = history_store.enabled and opts.store_id is not None
+    fields = opts.fields
+    extra: tuple = ()
+    if record and fields is not None:
+        extra = tuple(f for f in HISTORY_FIELDS if f not in fields)
+        fields = [*fields, *extra]
     try:
-        image_bytes = await file.read()
-        result = predict_from_bytes(image_bytes=image_bytes, include_masks=include_masks)
+        with profiler.capture():
+            result = predict_from_image(
+                decoded,
+                include_masks=opts.include_masks,
+                model_version=opts.model_version,
+                timer=timer,
+                params=opts.params,
+                fields=fields,
+                cascade=opts.cascade,
+                rle_masks=record and settings.history_store_masks,
+            )
+        if record:
+            _record_history(result, timer, opts)
+            for name in extra:
+                del result[name]
+        response.headers["Server-Timing"] = timer.server_timing()
         return result
+    except UnknownModelVersion as e:
+        # Pinned model_version is not loaded
+        raise HTTPException(status_code=404, detail=str(e.args[0])) from e
     except FileNotFoundError as e:
         # Model checkpoint missing
         log.exception("Model checkpoint not found.")
@@ -51,3 +226,71 @@ async def predict(
     except Exception as e:
         log.exception("Inference failed.")
         raise HTTPException(status_code=500, detail=f"Inference failed: {type(e).__name__}: {e}") from e
+
+
+def _timed(timer: StageTimer, stage: str, fn, *args):
+    # Timed inside the worker thread, so waiting for a free thread isn't counted as the stage.
+    with timer.stage(stage):
+        return fn(*args)
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Image is too large (limit {settings.max_upload_bytes} bytes).")
+
+
+@app.post("/predict")
+async def predict(
+    response: Response,
+    file: UploadFile = File(..., description="Image file (jpg/png)"),
+    opts: PredictOptions = Depends(),
+):
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=415, detail="Please upload an image file.")
+
+    timer = StageTimer()
+    with INFLIGHT.track_inprogress():
+        with timer.stage("read"):
+            image_bytes = await file.read()
+        if len(image_bytes) > settings.max_upload_bytes:
+            raise _too_large()
+        # Decoding and inference are CPU-bound; run them in the threadpool so the event
+        # loop keeps accepting requests (which then queue up in INFLIGHT).
+        try:
+            decoded = await run_in_threadpool(_timed, timer, "decode", decode_image_bytes, image_bytes)
+        except Exception as e:
+            raise HTTPException(status_code=415, detail=f"Could not decode image: {e}") from e
+        return await run_in_threadpool(_run_prediction, response, timer, opts, decoded)
+
+
+@app.post("/predict/raw")
+async def predict_raw(
+    request: Request,
+    response: Response,
+    opts: PredictOptions = Depends(),
+):
+    """
+    Same as /predict, but the request body is the image itself (Content-Type `image/*` or
+    `application/octet-stream`). No multipart parsing or temp-file spooling: the body is
+    size-checked, format-sniffed and decoded chunk by chunk as it arrives.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if not (content_type.startswith("image/") or content_type == "application/octet-stream"):
+        raise HTTPException(status_code=415, detail="Send the image as an image/* or application/octet-stream body.")
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > settings.max_upload_bytes:
+        raise _too_large()
+
+    timer = StageTimer()
+    with INFLIGHT.track_inprogress():
+        decoder = StreamingImageDecoder(settings.max_upload_bytes)
+        try:
+            # "read" includes the incremental decoding done while the body streams in.
+            with timer.stage("read"):
+                async for chunk in request.stream():
+                    decoder.feed(chunk)
+            decoded = await run_in_threadpool(_timed, timer, "decode", decoder.close)
+        except UploadTooLarge as e:
+            raise _too_large() from e
+        except UnsupportedImage as e:
+            raise HTTPException(status_code=415, detail=str(e)) from e
+        return await run_in_threadpool(_run_prediction, response, timer, opts, decoded)
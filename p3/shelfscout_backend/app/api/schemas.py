@@ -4,14 +4,62 @@ from typing import Dict, List, Optional
 from pydantic import BaseModel, Field
 
 
+class CascadeInfo(BaseModel):
+    decision: str = Field(..., description="short_circuit (screen result returned) or full")
+    reason: str
+    screen_empty_ratio: float = Field(..., ge=0.0, le=1.0)
+    screen_uncertain_fraction: float = Field(..., ge=0.0, le=1.0)
+    screen_image_size: int
+
+
 class PredictResponse(BaseModel):
-    empty_ratio: float = Field(..., ge=0.0, le=1.0)
-    decoded_centers: int = Field(..., ge=0)
-    predicted_instances: int = Field(..., ge=0)
-    product_pixels: int = Field(..., ge=0)
-    empty_pixels: int = Field(..., ge=0)
-    feature_map_size: List[int]
-    image_size: int
+    # All summary fields are present unless the request narrowed them with `fields=`.
+    empty_ratio: Optional[float] = Field(None, ge=0.0, le=1.0)
+    decoded_centers: Optional[int] = Field(None, ge=0)
+    predicted_instances: Optional[int] = Field(None, ge=0)
+    product_pixels: Optional[int] = Field(None, ge=0)
+    empty_pixels: Optional[int] = Field(None, ge=0)
+    feature_map_size: Optional[List[int]] = None
+    image_size: Optional[int] = None
     shelf_bbox: Optional[List[int]] = None
+    model_version: str
+    cascade: Optional[CascadeInfo] = None
+    # Row id when the result was recorded in the history store
+    history_id: Optional[int] = None
 
     masks: Optional[Dict[str, str]] = None
+
+
+class InputSpec(BaseModel):
+    image_size: int = Field(..., description="Model input is image_size x image_size")
+    width: int
+    height: int
+    resize: str = Field(..., description="How the server maps uploads to the input size (stretch)")
+    resample: str
+    stride: int
+    feature_map_size: List[int]
+    accepted_formats: List[str]
+    preferred_format: str = Field(..., description="Best encoding for downscaled uploads")
+    quality: int = Field(..., ge=1, le=100, description="Suggested JPEG/WebP quality")
+    max_upload_bytes: int
+
+
+class LoadModelRequest(BaseModel):
+    path: str = Field(..., description="Checkpoint path on the server")
+    version: Optional[str] = Field(None, description="Version label (default: checkpoint file stem)")
+    activate: bool = Field(True, description="Switch all traffic once loaded and warmed")
+    traffic_pct: Optional[float] = Field(
+        None, ge=0.0, le=100.0, description="If not activating, route this % of traffic to it as candidate"
+    )
+
+
+class CandidateRequest(BaseModel):
+    version: str
+    traffic_pct: float = Field(..., ge=0.0, le=100.0)
+
+
+class ProfileRequest(BaseModel):
+    requests: Optional[int] = Field(None, ge=1, le=1000, description="Profile the next N requests")
+    seconds: Optional[float] = Field(None, gt=0.0, le=3600.0, description="...or every request for T seconds")
+    python_sampling: bool = Field(True, description="Also sample Python stacks of the request thread")
+    sample_interval_ms: float = Field(5.0, ge=0.5, le=1000.0)
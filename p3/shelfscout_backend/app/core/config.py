@@ -7,11 +7,65 @@ from dataclasses import dataclass
 class Settings:
     # Path to a PyTorch checkpoint containing {"model_state": ...}
     model_path: str = os.getenv("MODEL_PATH", "checkpoints/shelfscout_latest.pth")
+    # "torch" serves MODEL_PATH; "stub" serves a checkpoint-free model that sleeps STUB_LATENCY_MS
+    # per forward pass and returns synthetic heads (real pre/post-processing; for load testing)
+    model_backend: str = os.getenv("MODEL_BACKEND", "torch").lower()
+    stub_latency_ms: float = float(os.getenv("STUB_LATENCY_MS", "50"))
+    # Extra latency for each additional image in a batch. No effect today: requests are
+    # forwarded one image at a time (there is no batcher yet)
+    stub_per_image_ms: float = float(os.getenv("STUB_PER_IMAGE_MS", "0"))
+    stub_jitter_ms: float = float(os.getenv("STUB_JITTER_MS", "0"))
+    stub_centers: int = int(os.getenv("STUB_CENTERS", "30"))
     # Force device: "cpu" | "cuda" | "auto"
     device: str = os.getenv("DEVICE", "auto").lower()
+    # Cascade: screen every request with a cheap low-res semantic-only pass and
+    # skip the full pipeline when the shelf is confidently stocked ("on" | "off")
+    cascade_mode: str = os.getenv("CASCADE_MODE", "off").lower()
+    cascade_image_size: int = int(os.getenv("CASCADE_IMAGE_SIZE", "256"))
+    # Short-circuit only if screen empty_ratio + margin <= threshold ...
+    cascade_empty_threshold: float = float(os.getenv("CASCADE_EMPTY_THRESHOLD", "0.15"))
+    cascade_margin: float = float(os.getenv("CASCADE_MARGIN", "0.05"))
+    # ... and at most this fraction of pixels has a product probability within +-band of 0.5
+    cascade_max_uncertain: float = float(os.getenv("CASCADE_MAX_UNCERTAIN", "0.10"))
+    cascade_band: float = float(os.getenv("CASCADE_BAND", "0.2"))
+    # Architecture for checkpoints that don't record one (older resnet50 checkpoints)
+    backbone: str = os.getenv("BACKBONE", "resnet50")
+    fpn_channels: int = int(os.getenv("FPN_CHANNELS", "256"))
     # Input image size (model expects square)
     image_size: int = int(os.getenv("IMAGE_SIZE", "512"))
     # Feature stride used in post-processing
     stride: int = int(os.getenv("STRIDE", "4"))
+    # Largest accepted upload (both /predict and the streaming /predict/raw)
+    max_upload_bytes: int = int(os.getenv("MAX_UPLOAD_BYTES", str(12 * 1024 * 1024)))
+    # JPEG/WebP quality clients should use when re-encoding downscaled uploads (see GET /input-spec)
+    upload_quality: int = int(os.getenv("UPLOAD_QUALITY", "90"))
+    # Post-processing defaults (each can also be overridden per request on /predict)
+    ctr_thresh: float = float(os.getenv("CTR_THRESH", "0.3"))
+    nms_kernel: int = int(os.getenv("NMS_KERNEL", "3"))
+    top_k: int = int(os.getenv("TOP_K", "200"))
+    sem_thresh: float = float(os.getenv("SEM_THRESH", "0.5"))
+    max_radius: float = float(os.getenv("MAX_RADIUS", "16"))
+    min_pixels: int = int(os.getenv("MIN_PIXELS", "12"))
+    shelf_margin: int = int(os.getenv("SHELF_MARGIN", "2"))
+    # Version label reported for the checkpoint at MODEL_PATH (default: file stem)
+    model_version: str = os.getenv("MODEL_VERSION", "")
+    # Run a dummy forward pass before a newly loaded model takes traffic
+    model_warmup: bool = os.getenv("MODEL_WARMUP", "true").lower() in {"1", "true", "yes"}
+    # Shared secret for /admin routes (sent as X-Admin-Token); empty disables them
+    admin_token: str = os.getenv("ADMIN_TOKEN", "")
+    # SQLite file for per-shelf prediction history (empty = disabled). /predict calls that pass
+    # store_id + shelf_id are recorded; query them under /history.
+    history_db_path: str = os.getenv("HISTORY_DB_PATH", "")
+    # Also keep run-length encoded product/empty masks (feature-map resolution) per record
+    history_store_masks: bool = os.getenv("HISTORY_STORE_MASKS", "false").lower() in {"1", "true", "yes"}
+    # Where on-demand profiler captures (Chrome traces + summaries) are written
+    profile_dir: str = os.getenv("PROFILE_DIR", "profiles")
+    # Requests captured when profiling is triggered without limits (e.g. via SIGUSR2)
+    profile_default_requests: int = int(os.getenv("PROFILE_DEFAULT_REQUESTS", "10"))
+
+    def __post_init__(self) -> None:
+        # Same rule as ?nms_kernel=: an even window shifts the max-pool and misaligns peaks.
+        if self.nms_kernel < 1 or self.nms_kernel % 2 == 0:
+            raise ValueError(f"NMS_KERNEL must be a positive odd integer (got {self.nms_kernel}).")
 
 settings = Settings()
@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from app.core.config import settings
+
+log = logging.getLogger("app.core.history")
+
+# results: one row per recorded prediction (append-only).
+# latest:  one row per shelf, upserted with each newer result, so "which shelves are
+#          empty right now" never scans the history.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id            INTEGER PRIMARY KEY,
+    store_id      TEXT    NOT NULL,
+    shelf_id      TEXT    NOT NULL,
+    camera_id     TEXT    NOT NULL DEFAULT '',
+    ts            REAL    NOT NULL,
+    empty_ratio   REAL,
+    instances     INTEGER,
+    bbox_ymin     INTEGER,
+    bbox_ymax     INTEGER,
+    bbox_xmin     INTEGER,
+    bbox_xmax     INTEGER,
+    model_version TEXT,
+    masks_rle     BLOB
+);
+CREATE INDEX IF NOT EXISTS ix_results_shelf_ts ON results (store_id, shelf_id, ts);
+CREATE INDEX IF NOT EXISTS ix_results_ts ON results (ts);
+
+CREATE TABLE IF NOT EXISTS latest (
+    store_id    TEXT    NOT NULL,
+    shelf_id    TEXT    NOT NULL,
+    camera_id   TEXT    NOT NULL,
+    ts          REAL    NOT NULL,
+    empty_ratio REAL,
+    instances   INTEGER,
+    result_id   INTEGER NOT NULL,
+    PRIMARY KEY (store_id, shelf_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_latest_empty_ratio ON latest (empty_ratio);
+"""
+
+_RESULT_COLUMNS = (
+    "id, store_id, shelf_id, camera_id, ts, empty_ratio, instances, "
+    "bbox_ymin, bbox_ymax, bbox_xmin, bbox_xmax, model_version"
+)
+
+
+def rle_encode(mask) -> Dict[str, Any]:
+    """Run lengths of a 2D boolean mask (tensor or array) in row-major order, starting with a run of False."""
+    if hasattr(mask, "cpu"):
+        mask = mask.cpu().numpy()
+    flat = np.asarray(mask, dtype=bool).ravel()
+    # Run boundaries, with a leading False so the first count is always a False run.
+    padded = np.concatenate(([False], flat))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    counts = np.diff(np.concatenate(([0], edges, [flat.size])))
+    return {"size": list(mask.shape), "counts": counts.tolist()}
+
+
+def rle_decode(rle: Dict[str, Any]) -> np.ndarray:
+    counts = np.asarray(rle["counts"], dtype=np.int64)
+    values = np.arange(len(counts)) % 2 == 1
+    return np.repeat(values, counts).reshape(rle["size"])
+
+
+class HistoryStore:
+    """
+    Prediction history in an embedded SQLite database (WAL mode, one connection per
+    thread). Disabled when `path` is empty.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._init_lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._initialized = True
+                    log.info("History store ready at %s", self.path)
+            self._local.conn = conn
+        return conn
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+
+    def record(
+        self,
+        store_id: str,
+        shelf_id: str,
+        result: Dict[str, Any],
+        camera_id: str = "",
+        ts: Optional[float] = None,
+        masks_rle: Optional[Dict[str, Any]] = None,
+    ) -> int:
+        """Append one /predict result and refresh the shelf's latest row. Returns the row id."""
+        return self.record_many([{
+            "store_id": store_id, "shelf_id": shelf_id, "camera_id": camera_id,
+            "ts": ts, "result": result, "masks_rle": masks_rle,
+        }])[0]
+
+    def record_many(self, records: Sequence[Dict[str, Any]]) -> List[int]:
+        """
+        Insert records ({store_id, shelf_id, camera_id, ts, result, masks_rle}) in one
+        transaction. Returns their row ids.
+        """
+        conn = self._conn()
+        ids: List[int] = []
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for rec in records:
+                ts = time.time() if rec.get("ts") is None else float(rec["ts"])
+                result = rec["result"]
+                bbox = result.get("shelf_bbox") or (None, None, None, None)
+                masks_rle = rec.get("masks_rle")
+                blob = zlib.compress(json.dumps(masks_rle, separators=(",", ":")).encode()) if masks_rle else None
+                key = (rec["store_id"], rec["shelf_id"], rec.get("camera_id") or "", ts)
+                cur = conn.execute(
+                    "INSERT INTO results (store_id, shelf_id, camera_id, ts, empty_ratio, instances, "
+                    "bbox_ymin, bbox_ymax, bbox_xmin, bbox_xmax, model_version, masks_rle) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (*key, result.get("empty_ratio"), result.get("predicted_instances"),
+                     *bbox, result.get("model_version"), blob),
+                )
+                ids.append(cur.lastrowid)
+                # Late-arriving (older) results don't overwrite a newer latest row, and a result
+                # without empty_ratio doesn't replace one that has it.
+                conn.execute(
+                    "INSERT INTO latest (store_id, shelf_id, camera_id, ts, empty_ratio, instances, result_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (store_id, shelf_id) DO UPDATE SET "
+                    "camera_id = excluded.camera_id, ts = excluded.ts, empty_ratio = excluded.empty_ratio, "
+                    "instances = excluded.instances, result_id = excluded.result_id "
+                    "WHERE excluded.ts >= latest.ts "
+                    "AND (excluded.empty_ratio IS NOT NULL OR latest.empty_ratio IS NULL)",
+                    (*key, result.get("empty_ratio"), result.get("predicted_instances"), cur.lastrowid),
+                )
+        return ids
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _row(row: sqlite3.Row) -> Dict[str, Any]:
+        out = dict(row)
+        bbox = [out.pop(k) for k in ("bbox_ymin", "bbox_ymax", "bbox_xmin", "bbox_xmax")]
+        out["shelf_bbox"] = bbox if bbox[0] is not None else None
+        if "masks_rle" in out:
+            blob = out.pop("masks_rle")
+            out["masks_rle"] = json.loads(zlib.decompress(blob)) if blob else None
+        return out
+
+    def range(
+        self,
+        store_id: Optional[str] = None,
+        shelf_id: Optional[str] = None,
+        start: Optional[float] = None,
+        end: Optional[float] = None,
+        camera_id: Optional[str] = None,
+        limit: int = 1000,
+        include_masks: bool = False,
+        newest_first: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Results within [start, end]: for one shelf (store_id + shelf_id, range scan on the
+        shelf/time index) or across shelves (range scan on the time index).
+        """
+        where: List[str] = []
+        args: List[Any] = []
+        for column, value in (("store_id", store_id), ("shelf_id", shelf_id), ("camera_id", camera_id)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                args.append(value)
+        if start is not None:
+            where.append("ts >= ?")
+            args.append(start)
+        if end is not None:
+            where.append("ts <= ?")
+            args.append(end)
+        sql = f"SELECT {_RESULT_COLUMNS}{', masks_rle' if include_masks else ''} FROM results"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY ts {'DESC' if newest_first else 'ASC'} LIMIT ?"
+        args.append(limit)
+        return [self._row(r) for r in self._conn().execute(sql, args)]
+
+    def trend(
+        self,
+        store_id: str,
+        shelf_id: str,
+        start: float,
+        end: float,
+        bucket_s: float,
+        window: int = 1,
+        camera_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        empty_ratio / instance averages per `bucket_s` seconds over [start, end], plus
+        `rolling_empty_ratio`: the mean over the trailing `window` buckets (by sample count).
+        """
+        sql = (
+            "SELECT CAST((ts - ?) / ? AS INTEGER) AS bucket, COUNT(empty_ratio) AS n, "
+            "SUM(empty_ratio) AS s, MIN(empty_ratio) AS lo, MAX(empty_ratio) AS hi, AVG(instances) AS inst "
+            "FROM results WHERE store_id = ? AND shelf_id = ? AND ts >= ? AND ts <= ?"
+        )
+        args: List[Any] = [start, bucket_s, store_id, shelf_id, start, end]
+        if camera_id is not None:
+            sql += " AND camera_id = ?"
+            args.append(camera_id)
+        sql += " GROUP BY bucket ORDER BY bucket"
+        rows = self._conn().execute(sql, args).fetchall()
+
+        out: List[Dict[str, Any]] = []
+        trailing: List[sqlite3.Row] = []
+        for r in rows:
+            trailing.append(r)
+            # Drop buckets that fell out of the trailing window (gaps count as empty buckets).
+            while trailing[0]["bucket"] <= r["bucket"] - window:
+                trailing.pop(0)
+            n = sum(t["n"] for t in trailing)
+            out.append({
+                "start": start + r["bucket"] * bucket_s,
+                "samples": r["n"],
+                "empty_ratio_avg": r["s"] / r["n"] if r["n"] else None,
+                "empty_ratio_min": r["lo"],
+                "empty_ratio_max": r["hi"],
+                "instances_avg": r["inst"],
+                "rolling_empty_ratio": sum(t["s"] or 0.0 for t in trailing) / n if n else None,
+            })
+        return out
+
+    def above_threshold(
+        self,
+        threshold: float,
+        store_id: Optional[str] = None,
+        max_age_s: Optional[float] = None,
+        limit: int = 1000,
+    ) -> List[Dict[str, Any]]:
+        """Shelves whose most recent result has empty_ratio >= threshold, emptiest first."""
+        sql = "SELECT store_id, shelf_id, camera_id, ts, empty_ratio, instances, result_id FROM latest " \
+              "WHERE empty_ratio >= ?"
+        args: List[Any] = [threshold]
+        if store_id is not None:
+            sql += " AND store_id = ?"
+            args.append(store_id)
+        if max_age_s is not None:
+            sql += " AND ts >= ?"
+            args.append(time.time() - max_age_s)
+        sql += " ORDER BY empty_ratio DESC LIMIT ?"
+        args.append(limit)
+        return [dict(r) for r in self._conn().execute(sql, args)]
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        return {
+            "path": self.path,
+            "results": conn.execute("SELECT MAX(id) FROM results").fetchone()[0] or 0,
+            "shelves": conn.execute("SELECT COUNT(*) FROM latest").fetchone()[0],
+        }
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+history_store = HistoryStore(settings.history_db_path)
+
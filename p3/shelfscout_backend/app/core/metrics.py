@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import GaugeMetricFamily
+
+# Stages are sub-millisecond to a few seconds (CPU forward), so buckets start low.
+_STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STAGE_SECONDS = Histogram(
+    "shelfscout_stage_seconds",
+    "Time spent in each inference pipeline stage, by serving model version "
+    "(empty for stages before a version is picked, e.g. read/decode).",
+    ["stage", "model_version"],
+    buckets=_STAGE_BUCKETS,
+)
+
+REQUEST_SECONDS = Histogram(
+    "shelfscout_request_seconds",
+    "End-to-end HTTP request latency by route.",
+    ["method", "route", "status"],
+    buckets=_STAGE_BUCKETS,
+)
+
+INFLIGHT = Gauge(
+    "shelfscout_inflight_requests",
+    "Inference requests accepted but not yet answered: running in the threadpool or waiting for a thread.",
+)
+
+CACHE_LOOKUPS = Counter(
+    "shelfscout_cache_lookups_total",
+    "Lookups in server-side caches by outcome.",
+    ["cache", "result"],
+)
+
+
+CASCADE_DECISIONS = Counter(
+    "shelfscout_cascade_decisions_total",
+    "Cascade screen outcomes (short_circuit = full pipeline skipped).",
+    ["decision"],
+)
+
+
+def cache_hit(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+class _ModelCollector:
+    """Exports the registry state (versions, device, traffic split) at scrape time."""
+
+    def describe(self):
+        # Skip the registration-time collect(); the model registry may not be importable yet.
+        return []
+
+    def collect(self):
+        # Imported lazily: the registry pulls in torch + the model definition.
+        from app.ml.registry import registry
+
+        status = registry.status()
+        info = GaugeMetricFamily(
+            "shelfscout_model_info",
+            "Loaded model versions (1 = loaded) with device and role.",
+            labels=["version", "device", "role"],
+        )
+        inflight = GaugeMetricFamily(
+            "shelfscout_model_inflight",
+            "In-flight requests per loaded model version.",
+            labels=["version"],
+        )
+        served = GaugeMetricFamily(
+            "shelfscout_model_served",
+            "Requests served per loaded model version since it was loaded.",
+            labels=["version"],
+        )
+        for v in status["versions"]:
+            if v["version"] == status["active"]:
+                role = "active"
+            elif v["version"] == status["candidate"]:
+                role = "candidate"
+            else:
+                role = "retired" if v["retired"] else "standby"
+            info.add_metric([v["version"], v["device"], role], 1.0)
+            inflight.add_metric([v["version"]], float(v["inflight"]))
+            served.add_metric([v["version"]], float(v["served"]))
+        yield info
+        yield inflight
+        yield served
+        yield GaugeMetricFamily(
+            "shelfscout_candidate_traffic_pct",
+            "Percentage of traffic routed to the candidate model.",
+            value=float(status["candidate_pct"]),
+        )
+
+
+REGISTRY.register(_ModelCollector())
+
+
+def render_latest():
+    """Return (body, content_type) for the /metrics endpoint."""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,55 @@
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import torch
+from torch.profiler import record_function
+
+from app.core.metrics import STAGE_SECONDS
+
+
+class StageTimer:
+    """
+    Per-request wall-clock timer for named pipeline stages.
+
+    Each stage is recorded once per request and observed into the
+    `shelfscout_stage_seconds` histogram, labelled with `model_version` once the
+    serving version is known (so A/B candidate vs active latency can be compared).
+    Durations are kept in milliseconds for the `Server-Timing` response header.
+    """
+
+    def __init__(self) -> None:
+        self.stages_ms: Dict[str, float] = {}
+        self.model_version = ""
+        self._t0 = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, sync: Optional[torch.device] = None) -> Iterator[None]:
+        """
+        Time the enclosed block. Pass `sync` for stages that queue CUDA work so
+        the kernel time is attributed here rather than to the next stage.
+        """
+        t0 = time.perf_counter()
+        try:
+            # Named range so live profiler traces attribute ops to pipeline stages.
+            with record_function(f"stage:{name}"):
+                yield
+        finally:
+            if sync is not None and sync.type == "cuda":
+                torch.cuda.synchronize(sync)
+            self.add(name, (time.perf_counter() - t0) * 1000.0)
+
+    def add(self, name: str, ms: float) -> None:
+        self.stages_ms[name] = self.stages_ms.get(name, 0.0) + ms
+        STAGE_SECONDS.labels(stage=name, model_version=self.model_version).observe(ms / 1000.0)
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000.0
+
+    def server_timing(self) -> str:
+        """Format as a `Server-Timing` header value, e.g. `forward;dur=812.4, total;dur=870.1`."""
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.stages_ms.items()]
+        parts.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(parts)
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+import torch
+
+from app.core.config import settings
+from app.core.metrics import CASCADE_DECISIONS
+
+SHORT_CIRCUIT = "short_circuit"
+FULL = "full"
+
+
+@dataclass(frozen=True)
+class CascadeConfig:
+    image_size: int = settings.cascade_image_size
+    empty_threshold: float = settings.cascade_empty_threshold
+    margin: float = settings.cascade_margin
+    max_uncertain: float = settings.cascade_max_uncertain
+    band: float = settings.cascade_band
+
+
+def screen_decision(
+    sem_prob: torch.Tensor,
+    empty_ratio: float,
+    shelf_bbox: Optional[Tuple[int, int, int, int]],
+    cfg: CascadeConfig,
+) -> Dict[str, Any]:
+    """
+    Decide from the low-res semantic map whether the full pipeline is needed.
+
+    Short-circuits only when a shelf was found, the estimated empty ratio is
+    clearly below the threshold and few pixels are ambiguous. "No products
+    found" is treated as uncertain: it may be an entirely empty shelf.
+    """
+    uncertain = float(((sem_prob - 0.5).abs() < cfg.band).float().mean().item())
+    if shelf_bbox is None:
+        decision, reason = FULL, "no_shelf_found"
+    elif empty_ratio + cfg.margin > cfg.empty_threshold:
+        decision, reason = FULL, "empty_ratio_near_or_above_threshold"
+    elif uncertain > cfg.max_uncertain:
+        decision, reason = FULL, "uncertain"
+    else:
+        decision, reason = SHORT_CIRCUIT, "confidently_stocked"
+    return {
+        "decision": decision,
+        "reason": reason,
+        "screen_empty_ratio": float(empty_ratio),
+        "screen_uncertain_fraction": uncertain,
+        "screen_image_size": cfg.image_size,
+    }
+
+
+class CascadeStats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {SHORT_CIRCUIT: 0, FULL: 0}
+
+    def record(self, decision: str) -> None:
+        CASCADE_DECISIONS.labels(decision=decision).inc()
+        with self._lock:
+            self._counts[decision] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self._counts.values())
+            return {
+                "screened": total,
+                "short_circuited": self._counts[SHORT_CIRCUIT],
+                "full": self._counts[FULL],
+                "short_circuit_fraction": self._counts[SHORT_CIRCUIT] / total if total else 0.0,
+            }
+
+
+cascade_stats = CascadeStats()
@@ -0,0 +1,20 @@
+from __future__ import annotations
+
+import logging
+
+import torch
+
+from app.core.config import settings
+
+log = logging.getLogger("app.ml.device")
+
+
+def get_device() -> torch.device:
+    if settings.device == "auto":
+        return torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    if settings.device in {"cpu", "cuda"}:
+        if settings.device == "cuda" and not torch.cuda.is_available():
+            log.warning("DEVICE=cuda requested but CUDA not available; falling back to CPU.")
+            return torch.device("cpu")
+        return torch.device(settings.device)
+    raise ValueError("DEVICE must be one of: auto, cpu, cuda")
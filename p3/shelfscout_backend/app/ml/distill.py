@@ -0,0 +1,247 @@
+"""
+Knowledge distillation from a trained ShelfScoutPanopticCNN (teacher) into a
+smaller student, e.g. a MobileNetV3 backbone with a narrower FPN.
+
+No labels are needed: the student learns to reproduce the teacher's semantic,
+center and offset outputs on unlabeled shelf images.
+
+Usage (from shelfscout_backend/):
+
+    python -m app.ml.distill \
+        --teacher checkpoints/shelfscout_latest.pth \
+        --images data/shelf_images \
+        --student-backbone mobilenet_v3_large --fpn-channels 128 --pretrained-backbone \
+        --epochs 20 --out checkpoints/shelfscout_mnv3.pth
+
+    # Agreement of an existing student with the teacher (held-out images)
+    python -m app.ml.distill --teacher ... --student checkpoints/shelfscout_mnv3.pth \
+        --images data/holdout --eval-only
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+
+from app.core.logging import setup_logging
+from app.ml.inference import image_to_tensor
+from app.ml.model import BACKBONES, ShelfScoutPanopticCNN
+from app.ml.postprocess import compute_empty_shelf_ratio_from_masks, compute_shelf_masks, decode_centers
+from app.ml.registry import load_checkpoint
+
+log = logging.getLogger("app.ml.distill")
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+class ShelfImageFolder(Dataset):
+    """Unlabeled images under `root` (recursive), resized like inference inputs."""
+
+    def __init__(self, root: str, image_size: int, hflip: bool = False):
+        self.paths = sorted(
+            os.path.join(d, f)
+            for d, _, files in os.walk(root)
+            for f in files
+            if f.lower().endswith(IMAGE_EXTS)
+        )
+        if not self.paths:
+            raise FileNotFoundError(f"No images found under '{root}'.")
+        self.image_size = image_size
+        self.hflip = hflip
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __getitem__(self, i: int) -> torch.Tensor:
+        img = Image.open(self.paths[i]).convert("RGB")
+        img = img.resize((self.image_size, self.image_size), resample=Image.BILINEAR)
+        x = image_to_tensor(img)
+        if self.hflip and torch.rand(()) < 0.5:
+            x = x.flip(-1)
+        return x
+
+
+def distillation_loss(
+    student_out,
+    teacher_out,
+    temperature: float = 2.0,
+    w_sem: float = 1.0,
+    w_ctr: float = 1.0,
+    w_off: float = 0.1,
+) -> Dict[str, torch.Tensor]:
+    """
+    sem : KL divergence between temperature-softened class distributions
+    ctr : BCE against the teacher's center probabilities (soft targets)
+    off : L1 on offsets, weighted by the teacher's product probability
+          (offsets are only meaningful on product pixels)
+    """
+    s_sem, s_ctr, s_off = student_out
+    t_sem, t_ctr, t_off = teacher_out
+
+    T = temperature
+    sem = F.kl_div(
+        F.log_softmax(s_sem / T, dim=1),
+        F.softmax(t_sem / T, dim=1),
+        reduction="batchmean",
+    ) * (T * T) / (s_sem.shape[-2] * s_sem.shape[-1])
+
+    ctr = F.binary_cross_entropy_with_logits(s_ctr, torch.sigmoid(t_ctr))
+
+    fg = torch.softmax(t_sem, dim=1)[:, 1:2]  # [B,1,Hf,Wf]
+    off = ((s_off - t_off).abs() * fg).sum() / fg.sum().clamp_min(1.0)
+
+    total = w_sem * sem + w_ctr * ctr + w_off * off
+    return {"total": total, "sem": sem, "ctr": ctr, "off": off}
+
+
+def distill(
+    teacher: ShelfScoutPanopticCNN,
+    student: ShelfScoutPanopticCNN,
+    loader: DataLoader,
+    epochs: int,
+    lr: float = 1e-3,
+    device: Optional[torch.device] = None,
+    temperature: float = 2.0,
+) -> List[Dict[str, float]]:
+    """Train `student` to match `teacher` outputs. Returns per-epoch mean losses."""
+    device = device or next(student.parameters()).device
+    teacher.eval()
+    student.train()
+    opt = torch.optim.AdamW(student.parameters(), lr=lr, weight_decay=1e-4)
+    sched = torch.optim.lr_scheduler.CosineAnnealingLR(opt, T_max=max(1, epochs * len(loader)))
+
+    history = []
+    for epoch in range(epochs):
+        sums: Dict[str, float] = {}
+        t0 = time.perf_counter()
+        for x in loader:
+            x = x.to(device, non_blocking=True)
+            with torch.no_grad():
+                t_out = teacher(x)
+            losses = distillation_loss(student(x), t_out, temperature=temperature)
+
+            opt.zero_grad(set_to_none=True)
+            losses["total"].backward()
+            opt.step()
+            sched.step()
+
+            for k, v in losses.items():
+                sums[k] = sums.get(k, 0.0) + float(v.detach())
+        row = {k: v / len(loader) for k, v in sums.items()}
+        row["epoch"] = epoch + 1
+        history.append(row)
+        log.info(
+            "epoch %d/%d loss=%.4f (sem=%.4f ctr=%.4f off=%.4f) %.0fs",
+            epoch + 1, epochs, row["total"], row["sem"], row["ctr"], row["off"], time.perf_counter() - t0,
+        )
+    student.eval()
+    return history
+
+
+@torch.no_grad()
+def evaluate_agreement(
+    teacher: ShelfScoutPanopticCNN,
+    student: ShelfScoutPanopticCNN,
+    loader: DataLoader,
+    stride: int = 4,
+) -> Dict[str, float]:
+    """
+    How closely the student reproduces the teacher on the outputs the API serves:
+    product-mask IoU, empty_ratio absolute error and decoded-center count error.
+    """
+    teacher.eval()
+    student.eval()
+    device = next(student.parameters()).device
+    ious, ratio_err, center_err = [], [], []
+    for x in loader:
+        x = x.to(device)
+        t_sem, t_ctr, _ = teacher(x)
+        s_sem, s_ctr, _ = student(x)
+        t_centers = decode_centers(t_ctr, stride=stride)
+        s_centers = decode_centers(s_ctr, stride=stride)
+        for b in range(x.shape[0]):
+            t_prob = torch.softmax(t_sem[b], dim=0)[1]
+            s_prob = torch.softmax(s_sem[b], dim=0)[1]
+            t_prod, t_empty, _, _ = compute_shelf_masks(t_prob)
+            s_prod, s_empty, _, _ = compute_shelf_masks(s_prob)
+            union = (t_prod | s_prod).sum().item()
+            ious.append((t_prod & s_prod).sum().item() / union if union else 1.0)
+            ratio_err.append(abs(
+                compute_empty_shelf_ratio_from_masks(t_empty, t_prod)
+                - compute_empty_shelf_ratio_from_masks(s_empty, s_prod)
+            ))
+            center_err.append(abs(len(t_centers[b]) - len(s_centers[b])))
+    n = max(1, len(ious))
+    return {
+        "images": len(ious),
+        "product_iou": sum(ious) / n,
+        "empty_ratio_mae": sum(ratio_err) / n,
+        "center_count_mae": sum(center_err) / n,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    setup_logging()
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--teacher", required=True, help="Teacher checkpoint (e.g. the current resnet50 model)")
+    ap.add_argument("--images", required=True, help="Folder of unlabeled shelf images")
+    ap.add_argument("--student", help="Resume from / evaluate this student checkpoint")
+    ap.add_argument("--student-backbone", default="mobilenet_v3_large", choices=BACKBONES)
+    ap.add_argument("--fpn-channels", type=int, default=128)
+    ap.add_argument("--pretrained-backbone", action="store_true", help="Start from ImageNet weights")
+    ap.add_argument("--image-size", type=int, default=512)
+    ap.add_argument("--epochs", type=int, default=20)
+    ap.add_argument("--batch-size", type=int, default=8)
+    ap.add_argument("--lr", type=float, default=1e-3)
+    ap.add_argument("--temperature", type=float, default=2.0)
+    ap.add_argument("--workers", type=int, default=2)
+    ap.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    ap.add_argument("--eval-images", help="Held-out images for the agreement report (default: --images)")
+    ap.add_argument("--eval-only", action="store_true")
+    ap.add_argument("--out", default="checkpoints/shelfscout_student.pth")
+    args = ap.parse_args(argv)
+
+    device = torch.device(args.device)
+    teacher = load_checkpoint(args.teacher, device)
+    if args.student:
+        student = load_checkpoint(args.student, device)
+    else:
+        student = ShelfScoutPanopticCNN(
+            backbone=args.student_backbone,
+            fpn_channels=args.fpn_channels,
+            pretrained_backbone=args.pretrained_backbone,
+        ).to(device)
+
+    history: List[Dict[str, float]] = []
+    if not args.eval_only:
+        train = ShelfImageFolder(args.images, args.image_size, hflip=True)
+        loader = DataLoader(
+            train, batch_size=args.batch_size, shuffle=True, num_workers=args.workers,
+            pin_memory=device.type == "cuda", drop_last=len(train) > args.batch_size,
+        )
+        history = distill(teacher, student, loader, args.epochs, lr=args.lr, device=device,
+                          temperature=args.temperature)
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        torch.save({
+            "model_state": student.state_dict(),
+            "arch": student.arch,
+            "distilled_from": os.path.basename(args.teacher),
+        }, args.out)
+        log.info("Student saved to %s", args.out)
+
+    held_out = ShelfImageFolder(args.eval_images or args.images, args.image_size)
+    report = evaluate_agreement(teacher, student, DataLoader(held_out, batch_size=args.batch_size))
+    report["arch"] = student.arch
+    log.info("Agreement with teacher: %s", report)
+    return {"history": history, "agreement": report}
+
+
+if __name__ == "__main__":
+    main()
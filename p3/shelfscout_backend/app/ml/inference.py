@@ -3,8 +3,8 @@ from __future__ import annotations
 import base64
 import io
 import logging
-from functools import lru_cache
-from typing import Any, Dict, Optional
+from functools import cached_property
+from typing import Any, Dict, Optional, Sequence, Tuple
 
 import numpy as np
 import torch
@@ -12,59 +12,151 @@ import torch.nn.functional as F
 from PIL import Image, ImageDraw
 
 from app.core.config import settings
+from app.core.history import rle_encode
+from app.core.timing import StageTimer
+from app.ml.cascade import SHORT_CIRCUIT, CascadeConfig, cascade_stats, screen_decision
 from app.ml.model import ShelfScoutPanopticCNN
 from app.ml.postprocess import (
-    STRIDE,
+    PostprocessEngine,
+    PostprocessParams,
     compute_empty_shelf_ratio_from_masks,
-    compute_shelf_masks,
-    decode_centers,
-    reconstruct_instances,
+    get_engine,
 )
+from app.ml.registry import registry
 
 log = logging.getLogger("app.ml.inference")
 
-
-def get_device() -> torch.device:
-    if settings.device == "auto":
-        return torch.device("cuda" if torch.cuda.is_available() else "cpu")
-    if settings.device in {"cpu", "cuda"}:
-        if settings.device == "cuda" and not torch.cuda.is_available():
-            log.warning("DEVICE=cuda requested but CUDA not available; falling back to CPU.")
-            return torch.device("cpu")
-        return torch.device(settings.device)
-    raise ValueError("DEVICE must be one of: auto, cpu, cuda")
+DEFAULT_POSTPROCESS = PostprocessParams(
+    prob_thresh=settings.ctr_thresh,
+    nms_kernel=settings.nms_kernel,
+    top_k=settings.top_k,
+    sem_thresh=settings.sem_thresh,
+    max_radius=settings.max_radius,
+    min_pixels=settings.min_pixels,
+    margin=settings.shelf_margin,
+)
 
 
-@lru_cache(maxsize=1)
 def load_model() -> ShelfScoutPanopticCNN:
-    device = get_device()
-    model = ShelfScoutPanopticCNN().to(device)
+    """Return the model currently serving default traffic (loads MODEL_PATH on first use)."""
+    return registry.active().model
+
+
+# Upload formats decoded by the server, in the order clients should prefer them.
+ACCEPTED_FORMATS: Tuple[str, ...] = ("image/webp", "image/jpeg", "image/png")
+
+
+def input_spec() -> Dict[str, Any]:
+    """
+    Input geometry clients can use to downscale/re-encode before upload. Every image is
+    stretched (not letterboxed) to image_size x image_size with bilinear resampling, so
+    pixels beyond that are discarded server-side anyway.
+    """
+    return {
+        "image_size": settings.image_size,
+        "width": settings.image_size,
+        "height": settings.image_size,
+        "resize": "stretch",
+        "resample": "bilinear",
+        "stride": settings.stride,
+        "feature_map_size": [settings.image_size // settings.stride] * 2,
+        "accepted_formats": list(ACCEPTED_FORMATS),
+        "preferred_format": ACCEPTED_FORMATS[0],
+        "quality": settings.upload_quality,
+        "max_upload_bytes": settings.max_upload_bytes,
+    }
+
+
+class UploadTooLarge(ValueError):
+    """The upload exceeds MAX_UPLOAD_BYTES."""
 
-    ckpt_path = settings.model_path
-    try:
-        ckpt = torch.load(ckpt_path, map_location=device)
-    except FileNotFoundError as e:
-        raise FileNotFoundError(
-            f"Checkpoint not found at '{ckpt_path}'. "
-            f"Place it there or set MODEL_PATH to the correct path."
-        ) from e
 
-    if "model_state" not in ckpt:
-        raise KeyError("Checkpoint missing key 'model_state'.")
+class UnsupportedImage(ValueError):
+    """The upload is not a decodable JPEG/PNG/WebP image."""
 
-    model.load_state_dict(ckpt["model_state"])
-    model.eval()
-    log.info("Model loaded. device=%s path=%s", device, ckpt_path)
-    return model
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    """MIME type from the first bytes of an upload (magic numbers), or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+class StreamingImageDecoder:
+    """
+    Consumes an upload while it is still arriving. The format is sniffed from the first
+    bytes and the header is parsed as soon as it is complete, so non-images, corrupt
+    headers and decompression bombs are rejected before the rest of the body is read.
+    The size limit is checked on every chunk. Pixel data is decoded once on close()
+    (Pillow cannot decode JPEG/PNG/WebP incrementally).
+    """
+
+    SNIFF_BYTES = 12
+    # Stop probing for the header after this many bytes (huge EXIF blocks); close() still decodes.
+    HEADER_PROBE_LIMIT = 1 << 20
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.format: Optional[str] = None
+        self.image_size: Optional[Tuple[int, int]] = None  # (width, height) once the header is parsed
+        self._buf = bytearray()
+
+    @property
+    def size(self) -> int:
+        return len(self._buf)
+
+    def feed(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        if len(self._buf) + len(chunk) > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds the {self.max_bytes} byte limit.")
+        self._buf += chunk
+        if self.format is None and len(self._buf) >= self.SNIFF_BYTES:
+            self.format = sniff_image_format(bytes(self._buf[: self.SNIFF_BYTES]))
+            if self.format is None:
+                raise UnsupportedImage("Unrecognized image format (expected JPEG, PNG or WebP).")
+        if self.format is not None and self.image_size is None and len(self._buf) <= self.HEADER_PROBE_LIMIT:
+            self._probe_header()
+
+    def _probe_header(self) -> None:
+        try:
+            with Image.open(io.BytesIO(self._buf)) as img:
+                self.image_size = img.size
+        except Image.DecompressionBombError as e:
+            raise UnsupportedImage(str(e)) from e
+        except (OSError, SyntaxError, ValueError):
+            pass  # header not complete yet
+
+    def close(self) -> Image.Image:
+        """Decode the complete upload and return the RGB image."""
+        if self.format is None:
+            raise UnsupportedImage("Empty or truncated upload.")
+        try:
+            return decode_image_bytes(bytes(self._buf))
+        except (OSError, SyntaxError, ValueError) as e:
+            raise UnsupportedImage(f"Could not decode image: {e}") from e
+
+
+def decode_image_bytes(image_bytes: bytes) -> Image.Image:
+    """Decode encoded image bytes (jpg/png/webp) to an RGB PIL image."""
+    return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+
+def image_to_tensor(img: Image.Image) -> torch.Tensor:
+    """Return normalized tensor [3, H, W] from an RGB PIL image."""
+    arr = np.asarray(img, dtype=np.float32) / 255.0  # [H,W,3]
+    return torch.from_numpy(arr).permute(2, 0, 1).contiguous()  # [3,H,W]
 
 
 def preprocess_image_bytes(image_bytes: bytes, image_size: int) -> torch.Tensor:
     """Return normalized tensor [3, image_size, image_size] in RGB."""
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
+    img = decode_image_bytes(image_bytes)
     img = img.resize((image_size, image_size), resample=Image.BILINEAR)
-    arr = np.asarray(img, dtype=np.float32) / 255.0  # [H,W,3]
-    tensor = torch.from_numpy(arr).permute(2, 0, 1).contiguous()  # [3,H,W]
-    return tensor
+    return image_to_tensor(img)
 
 
 def _mask_to_base64_png(mask: torch.Tensor, out_size: int) -> str:
@@ -89,10 +181,9 @@ def _mask_to_base64_png(mask: torch.Tensor, out_size: int) -> str:
     return base64.b64encode(buf.getvalue()).decode("utf-8")
 
 
-def _centers_overlay_to_base64_png(image_bytes: bytes, centers, out_size: int, radius: int = 5) -> str:
+def _centers_overlay_to_base64_png(resized: Image.Image, centers, radius: int = 5) -> str:
     """Draw decoded centers over the resized input image and return base64 PNG."""
-    img = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-    img = img.resize((out_size, out_size), resample=Image.BILINEAR)
+    img = resized.copy()
     draw = ImageDraw.Draw(img)
     for c in centers:
         # c: tensor [x,y] or [x,y,score]
@@ -108,55 +199,246 @@ def _centers_overlay_to_base64_png(image_bytes: bytes, centers, out_size: int, r
     return base64.b64encode(buf.getvalue()).decode("ascii")
 
 
+# Response field -> model heads needed to compute it.
+FIELD_HEADS: Dict[str, Tuple[str, ...]] = {
+    "empty_ratio": ("sem",),
+    "decoded_centers": ("ctr",),
+    "predicted_instances": ("sem", "ctr", "off"),
+    "product_pixels": ("sem",),
+    "empty_pixels": ("sem",),
+    "feature_map_size": ("sem",),
+    "image_size": (),
+    "shelf_bbox": ("sem",),
+}
+ALL_FIELDS: Tuple[str, ...] = tuple(FIELD_HEADS)
+# Fields the cascade screen can't estimate (it runs the semantic head only)
+INSTANCE_FIELDS: Tuple[str, ...] = ("decoded_centers", "predicted_instances")
+# Mask PNGs + centers overlay
+MASKS_HEADS: Tuple[str, ...] = ("sem", "ctr")
+
+
+def required_heads(fields: Sequence[str], include_masks: bool) -> Tuple[str, ...]:
+    needed = {h for f in fields for h in FIELD_HEADS[f]}
+    if include_masks:
+        needed.update(MASKS_HEADS)
+    return tuple(h for h in ShelfScoutPanopticCNN.HEADS if h in needed)
+
+
+class _PredictionGraph:
+    """
+    Post-processing stages as lazily evaluated nodes: a node runs (and is timed)
+    only when a requested output depends on it, and at most once per request.
+    """
+
+    def __init__(
+        self,
+        outputs,
+        resized: Image.Image,
+        timer: StageTimer,
+        params: PostprocessParams,
+        scale: float = 1.0,
+        stage_prefix: str = "",
+    ):
+        self.sem_logits, self.ctr_logits, self.offsets = outputs
+        self.resized = resized
+        self.timer = timer
+        self.params = params
+        # Reduced-resolution graphs (cascade screen) report sizes in full-resolution feature space.
+        self.scale = scale
+        self.stage_prefix = stage_prefix
+
+    def _stage(self, name: str):
+        return self.timer.stage(self.stage_prefix + name)
+
+    @cached_property
+    def engine(self) -> PostprocessEngine:
+        ref = next(t for t in (self.sem_logits, self.ctr_logits, self.offsets) if t is not None)
+        return get_engine(ref.shape[-2], ref.shape[-1], settings.stride, ref.device)
+
+    @cached_property
+    def sem_prob(self) -> torch.Tensor:
+        with self._stage("semantic"):
+            # Foreground semantic probability in feature space [Hf,Wf]
+            return torch.softmax(self.sem_logits[0], dim=0)[1]  # keep on device
+
+    @cached_property
+    def centers(self) -> torch.Tensor:
+        with self._stage("centers"):
+            return self.engine.decode_centers(self.ctr_logits, self.params)[0]  # [K,3] (x,y,score) in pixel space
+
+    @cached_property
+    def predicted_instances(self) -> int:
+        sem_prob, centers = self.sem_prob, self.centers
+        with self._stage("reconstruct"):
+            instance_map = self.engine.reconstruct_instances(
+                sem_prob=sem_prob,
+                ctr_points=centers,
+                offsets=self.offsets[0],
+                params=self.params,
+            )
+            return PostprocessEngine.count_instances(instance_map)
+
+    @cached_property
+    def shelf(self) -> Dict[str, Any]:
+        sem_prob = self.sem_prob
+        with self._stage("masks"):
+            product_mask, empty_mask, background_mask, shelf_bbox = self.engine.shelf_masks(sem_prob, self.params)
+            return {
+                "product_mask": product_mask,
+                "empty_mask": empty_mask,
+                "background_mask": background_mask,
+                "shelf_bbox": shelf_bbox,
+                "empty_ratio": compute_empty_shelf_ratio_from_masks(empty_mask, product_mask),
+                "product_pixels": int(product_mask.sum().item()),
+                "empty_pixels": int(empty_mask.sum().item()),
+            }
+
+    def field(self, name: str) -> Any:
+        if name == "empty_ratio":
+            return float(self.shelf["empty_ratio"])
+        if name in ("product_pixels", "empty_pixels"):
+            return int(round(self.shelf[name] * self.scale ** 2))
+        if name == "shelf_bbox":
+            bbox = self.shelf["shelf_bbox"]
+            if bbox is None:
+                return None
+            ymin, ymax, xmin, xmax = bbox  # ymin,ymax,xmin,xmax in feature space
+            k = self.scale
+            return [round(ymin * k), round((ymax + 1) * k) - 1, round(xmin * k), round((xmax + 1) * k) - 1]
+        if name == "feature_map_size":
+            return [int(round(self.sem_prob.shape[0] * self.scale)), int(round(self.sem_prob.shape[1] * self.scale))]
+        if name == "decoded_centers":
+            # None when the center head was not run (cascade short-circuit)
+            return int(len(self.centers)) if self.ctr_logits is not None else None
+        if name == "predicted_instances":
+            return self.predicted_instances if self.offsets is not None else None
+        if name == "image_size":
+            return settings.image_size
+        raise KeyError(name)
+
+    def masks(self) -> Dict[str, str]:
+        shelf, centers = self.shelf, self.centers
+        with self._stage("encode"):
+            return {
+                "product_mask_png_b64": _mask_to_base64_png(shelf["product_mask"], settings.image_size),
+                "empty_mask_png_b64": _mask_to_base64_png(shelf["empty_mask"], settings.image_size),
+                "background_mask_png_b64": _mask_to_base64_png(shelf["background_mask"], settings.image_size),
+                # Input image with decoded center points drawn on top:
+                "decoded_centers_overlay_png_b64": _centers_overlay_to_base64_png(self.resized, centers),
+            }
+
+
+def _forward(served, decoded: Image.Image, image_size: int, heads, timer: StageTimer, stage_prefix: str = ""):
+    """Resize + run the requested heads. Returns ((sem, ctr, off), resized image)."""
+    with timer.stage(stage_prefix + "preprocess"):
+        resized = decoded.resize((image_size, image_size), resample=Image.BILINEAR)
+        img = image_to_tensor(resized).to(served.device)  # [3,S,S]
+
+    if not heads:
+        return (None, None, None), resized
+    with timer.stage(stage_prefix + "forward", sync=served.device), torch.no_grad():
+        return served.model(img.unsqueeze(0), heads=heads), resized
+
+
 def predict_from_bytes(
     image_bytes: bytes,
     include_masks: bool = False,
+    model_version: Optional[str] = None,
+    timer: Optional[StageTimer] = None,
+    params: Optional[PostprocessParams] = None,
+    fields: Optional[Sequence[str]] = None,
+    cascade: Optional[bool] = None,
+) -> Dict[str, Any]:
+    """Decode encoded image bytes and run `predict_from_image` on them."""
+    timer = timer or StageTimer()
+    with timer.stage("decode"):
+        decoded = decode_image_bytes(image_bytes)
+    return predict_from_image(
+        decoded,
+        include_masks=include_masks,
+        model_version=model_version,
+        timer=timer,
+        params=params,
+        fields=fields,
+        cascade=cascade,
+    )
+
+
+def predict_from_image(
+    decoded: Image.Image,
+    include_masks: bool = False,
+    model_version: Optional[str] = None,
+    timer: Optional[StageTimer] = None,
+    params: Optional[PostprocessParams] = None,
+    fields: Optional[Sequence[str]] = None,
+    cascade: Optional[bool] = None,
+    rle_masks: bool = False,
 ) -> Dict[str, Any]:
     """
-    Runs model inference + post-processing on an image.
+    Runs model inference + post-processing on a decoded RGB image.
     Returns a JSON-serializable dict.
-    """
-    device = get_device()
-    model = load_model()
 
-    img = preprocess_image_bytes(image_bytes, settings.image_size).to(device)  # [3,512,512]
+    The serving model is chosen by the registry (active, or the A/B candidate);
+    pass `model_version` to pin a specific loaded version. Stage durations are
+    recorded on `timer` (a fresh one is used if not given). `params` overrides
+    the env-configured post-processing thresholds.
 
-    with torch.no_grad():
-        sem_logits, ctr_logits, offsets = model(img.unsqueeze(0))
+    `fields` limits the output to a subset of ALL_FIELDS; only the model heads and
+    post-processing stages those fields depend on are run (e.g. fields=["empty_ratio"]
+    skips the center/offset heads, center decoding and instance reconstruction).
 
-    # Foreground semantic probability in feature space [Hf,Wf]
-    sem_prob = torch.softmax(sem_logits[0], dim=0)[1]  # keep on device
+    `cascade` (default: CASCADE_MODE) first runs a low-res semantic-only screen and
+    returns its estimate when the shelf is confidently stocked; instance fields are
+    then None. The decision is reported under "cascade". Masks, and instance fields
+    requested explicitly through `fields`, always need the full run, and requests that
+    need no model head (e.g. fields=["image_size"]) are never screened.
 
-    centers = decode_centers(ctr_logits, stride=settings.stride)[0]  # list of [x,y,score] in pixel space
-    instance_map = reconstruct_instances(
-        sem_prob=sem_prob,
-        ctr_points=centers,
-        offsets=offsets[0],
-    )
+    `rle_masks` adds run-length encoded product/empty masks (feature-map resolution)
+    under "masks_rle", the compact form kept by the history store.
+    """
+    timer = timer or StageTimer()
+    params = params or DEFAULT_POSTPROCESS
+    wants_instances = bool(fields) and any(f in INSTANCE_FIELDS for f in fields)
+    fields = tuple(fields) if fields else ALL_FIELDS
+    unknown = [f for f in fields if f not in FIELD_HEADS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}. Valid: {', '.join(ALL_FIELDS)}")
+    heads = required_heads(fields, include_masks)
+    if cascade is None:
+        cascade = settings.cascade_mode == "on"
+    # No screen when it can't save anything (no heads needed) or its estimate can't
+    # answer the request (masks, instance fields).
+    cascade = cascade and bool(heads) and not include_masks and not wants_instances
 
-    product_mask, empty_mask, background_mask, shelf_bbox = compute_shelf_masks(sem_prob)
-    empty_ratio = compute_empty_shelf_ratio_from_masks(empty_mask, product_mask)
-
-    # summary stats
-    predicted_instances = int(instance_map.unique().numel() - 1)
-    out: Dict[str, Any] = {
-        "empty_ratio": float(empty_ratio),
-        "decoded_centers": int(len(centers)),
-        "predicted_instances": predicted_instances,
-        "product_pixels": int(product_mask.sum().item()),
-        "empty_pixels": int(empty_mask.sum().item()),
-        "feature_map_size": [int(sem_prob.shape[0]), int(sem_prob.shape[1])],
-        "image_size": settings.image_size,
-        "shelf_bbox": list(shelf_bbox) if shelf_bbox is not None else None,  # ymin,ymax,xmin,xmax in feature space
-    }
+    screen: Optional[Dict[str, Any]] = None
+    with registry.lease(model_version) as served:
+        timer.model_version = served.version
+        if cascade:
+            cfg = CascadeConfig()
+            outputs, resized = _forward(served, decoded, cfg.image_size, ("sem",), timer, stage_prefix="screen_")
+            graph = _PredictionGraph(
+                outputs, resized, timer, params,
+                scale=settings.image_size / cfg.image_size,
+                stage_prefix="screen_",
+            )
+            screen = screen_decision(graph.sem_prob, graph.shelf["empty_ratio"], graph.shelf["shelf_bbox"], cfg)
+            cascade_stats.record(screen["decision"])
+
+        if screen is None or screen["decision"] != SHORT_CIRCUIT:
+            outputs, resized = _forward(served, decoded, settings.image_size, heads, timer)
+            graph = _PredictionGraph(outputs, resized, timer, params)
+
+    out: Dict[str, Any] = {name: graph.field(name) for name in fields}
+    out["model_version"] = served.version
+    if screen is not None:
+        out["cascade"] = screen
 
     if include_masks:
-        out["masks"] = {
-            "product_mask_png_b64": _mask_to_base64_png(product_mask, settings.image_size),
-            "empty_mask_png_b64": _mask_to_base64_png(empty_mask, settings.image_size),
-            "background_mask_png_b64": _mask_to_base64_png(background_mask, settings.image_size),
-            # Input image with decoded center points drawn on top:
-            "decoded_centers_overlay_png_b64": _centers_overlay_to_base64_png(image_bytes, centers, settings.image_size),
+        out["masks"] = graph.masks()
+    if rle_masks:
+        out["masks_rle"] = {
+            "product": rle_encode(graph.shelf["product_mask"]),
+            "empty": rle_encode(graph.shelf["empty_mask"]),
         }
 
     return out
@@ -53,12 +53,31 @@ class CBAM(nn.Module):
 # Backbone + FPN + Model
 # ============================================================
 
+_RESNETS = {
+    # name: (constructor, weights enum, stage channels c2..c5)
+    "resnet18": (models.resnet18, models.ResNet18_Weights, (64, 128, 256, 512)),
+    "resnet34": (models.resnet34, models.ResNet34_Weights, (64, 128, 256, 512)),
+    "resnet50": (models.resnet50, models.ResNet50_Weights, (256, 512, 1024, 2048)),
+    "resnet101": (models.resnet101, models.ResNet101_Weights, (256, 512, 1024, 2048)),
+}
+
+_FEATURE_NETS = {
+    # Backbones exposing a `.features` Sequential; stage taps are found by probing strides.
+    "mobilenet_v3_small": (models.mobilenet_v3_small, models.MobileNet_V3_Small_Weights),
+    "mobilenet_v3_large": (models.mobilenet_v3_large, models.MobileNet_V3_Large_Weights),
+    "efficientnet_b0": (models.efficientnet_b0, models.EfficientNet_B0_Weights),
+}
+
+BACKBONES = tuple(_RESNETS) + tuple(_FEATURE_NETS)
+
+
 class ResNetBackboneCBAM(nn.Module):
     def __init__(self, name="resnet50", pretrained: bool = False):
         super().__init__()
 
-        weights = models.ResNet50_Weights.DEFAULT if pretrained else None
-        base = models.resnet50(weights=weights)
+        ctor, weights_enum, channels = _RESNETS[name]
+        weights = weights_enum.DEFAULT if pretrained else None
+        base = ctor(weights=weights)
 
         self.conv1 = base.conv1
         self.bn1 = base.bn1
@@ -70,12 +89,12 @@ class ResNetBackboneCBAM(nn.Module):
         self.layer3 = base.layer3
         self.layer4 = base.layer4
 
-        self.cbam2 = CBAM(256)
-        self.cbam3 = CBAM(512)
-        self.cbam4 = CBAM(1024)
-        self.cbam5 = CBAM(2048)
+        self.cbam2 = CBAM(channels[0])
+        self.cbam3 = CBAM(channels[1])
+        self.cbam4 = CBAM(channels[2])
+        self.cbam5 = CBAM(channels[3])
 
-        self.out_channels = (256, 512, 1024, 2048)
+        self.out_channels = channels
 
     def forward(self, x):
         x = self.relu(self.bn1(self.conv1(x)))
@@ -89,6 +108,57 @@ class ResNetBackboneCBAM(nn.Module):
         return {"c2": c2, "c3": c3, "c4": c4, "c5": c5}
 
 
+class FeaturesBackboneCBAM(nn.Module):
+    """
+    Lightweight backbones (MobileNetV3, EfficientNet). The last block at each of
+    strides 4/8/16/32 is tapped as c2..c5, so the FPN wiring matches ResNet's.
+    """
+
+    def __init__(self, name="mobilenet_v3_large", pretrained: bool = False):
+        super().__init__()
+
+        ctor, weights_enum = _FEATURE_NETS[name]
+        weights = weights_enum.DEFAULT if pretrained else None
+        self.features = ctor(weights=weights).features
+
+        self.taps, channels = self._probe_taps(self.features)
+        self.cbams = nn.ModuleList([CBAM(c) for c in channels])
+        self.out_channels = tuple(channels)
+
+    @staticmethod
+    def _probe_taps(features: nn.Sequential, size: int = 64):
+        """Return (indices, channels) of the last block at strides 4, 8, 16 and 32."""
+        last_at_stride = {}
+        was_training = features.training
+        features.eval()
+        with torch.no_grad():
+            x = torch.zeros(1, 3, size, size)
+            for i, block in enumerate(features):
+                x = block(x)
+                last_at_stride[size // x.shape[-1]] = (i, x.shape[1])
+        features.train(was_training)
+        taps = [last_at_stride[s] for s in (4, 8, 16, 32)]
+        return [i for i, _ in taps], [c for _, c in taps]
+
+    def forward(self, x):
+        outs = []
+        for i, block in enumerate(self.features):
+            x = block(x)
+            if i in self.taps:
+                outs.append(self.cbams[len(outs)](x))
+            if len(outs) == 4:
+                break
+        return {"c2": outs[0], "c3": outs[1], "c4": outs[2], "c5": outs[3]}
+
+
+def build_backbone(name: str = "resnet50", pretrained: bool = False) -> nn.Module:
+    if name in _RESNETS:
+        return ResNetBackboneCBAM(name, pretrained=pretrained)
+    if name in _FEATURE_NETS:
+        return FeaturesBackboneCBAM(name, pretrained=pretrained)
+    raise ValueError(f"Unknown backbone '{name}'. Choose one of: {', '.join(BACKBONES)}")
+
+
 class FPN(nn.Module):
     def __init__(self, in_channels, fpn_channels=256):
         super().__init__()
@@ -112,31 +182,44 @@ class FPN(nn.Module):
         return {"p2": self.s2(p2), "p3": self.s3(p3), "p4": self.s4(p4), "p5": self.s5(p5)}
 
 class ConvHead(nn.Module):
-    def __init__(self, in_ch, out_ch):
+    def __init__(self, in_ch, out_ch, mid_ch=256):
         super().__init__()
         self.net = nn.Sequential(
-            nn.Conv2d(in_ch, 256, 3, padding=1),
+            nn.Conv2d(in_ch, mid_ch, 3, padding=1),
             nn.ReLU(),
-            nn.Conv2d(256, out_ch, 1)
+            nn.Conv2d(mid_ch, out_ch, 1)
         )
 
     def forward(self, x):
         return self.net(x)
 
 class ShelfScoutPanopticCNN(nn.Module):
-    def __init__(self):
+    def __init__(self, backbone: str = "resnet50", fpn_channels: int = 256, pretrained_backbone: bool = False):
         super().__init__()
-        self.backbone = ResNetBackboneCBAM()
-        self.fpn = FPN(self.backbone.out_channels)
-
-        self.sem_head = ConvHead(256, 2)
-        self.ctr_head = ConvHead(256, 1)
-        self.off_head = ConvHead(256, 2)
-
-    def forward(self, x):
+        # Saved next to the weights so checkpoints rebuild the same architecture.
+        self.arch = {"backbone": backbone, "fpn_channels": fpn_channels}
+        self.backbone = build_backbone(backbone, pretrained=pretrained_backbone)
+        self.fpn = FPN(self.backbone.out_channels, fpn_channels)
+
+        # FPN + heads run at stride 4, so their width matters as much as the backbone's.
+        self.sem_head = ConvHead(fpn_channels, 2, fpn_channels)
+        self.ctr_head = ConvHead(fpn_channels, 1, fpn_channels)
+        self.off_head = ConvHead(fpn_channels, 2, fpn_channels)
+
+    HEADS = ("sem", "ctr", "off")
+
+    def forward(self, x, heads=HEADS):
+        """
+        Returns (sem_logits, ctr_logits, offsets). Heads not listed in `heads`
+        are skipped and returned as None (e.g. heads=("sem",) for summary-only use).
+        """
         feats = self.backbone(x)
         p2 = self.fpn(feats)["p2"]
-        return self.sem_head(p2), self.ctr_head(p2), self.off_head(p2)
+        return (
+            self.sem_head(p2) if "sem" in heads else None,
+            self.ctr_head(p2) if "ctr" in heads else None,
+            self.off_head(p2) if "off" in heads else None,
+        )
 
 
 
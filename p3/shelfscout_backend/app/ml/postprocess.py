@@ -1,47 +1,159 @@
 from __future__ import annotations
 
+import threading
+from dataclasses import dataclass, replace
+from typing import Any, Dict, Tuple
+
 import torch
 import torch.nn.functional as F
 
+from app.core.metrics import cache_hit
+
 # Default stride used by the model head / feature map
 STRIDE_DEFAULT = 4
 
 STRIDE = STRIDE_DEFAULT
 
 
-def decode_centers(ctr_logits, stride, prob_thresh=0.3, nms_kernel=3, top_k=200):
-    B, _, Hf, Wf = ctr_logits.shape
-    ctr_probs = torch.sigmoid(ctr_logits)
+# Thresholds for center decoding, instance reconstruction and shelf masks.
+# Defaults match the training notebook; inference overrides them from env/request.
+@dataclass(frozen=True)
+class PostprocessParams:
+    prob_thresh: float = 0.3
+    nms_kernel: int = 3
+    top_k: int = 200
+    sem_thresh: float = 0.5
+    max_radius: float = 16.0   # feature-space pixels
+    min_pixels: int = 12       # remove tiny noisy instances
+    margin: int = 2
 
-    pooled = F.max_pool2d(
-        ctr_probs,
-        kernel_size=nms_kernel,
-        stride=1,
-        padding=nms_kernel // 2
-    )
+    def with_overrides(self, **overrides: Any) -> "PostprocessParams":
+        """Return a copy with every non-None override applied."""
+        return replace(self, **{k: v for k, v in overrides.items() if v is not None})
 
-    keep = (ctr_probs == pooled) & (ctr_probs > prob_thresh)
-    decoded = []
 
-    for b in range(B):
-        ys, xs = torch.where(keep[b, 0])
-        scores = ctr_probs[b, 0, ys, xs]
+class PostprocessEngine:
+    """
+    Post-processing for one feature-map geometry (Hf, Wf, stride, device).
 
-        if len(scores) > top_k:
-            scores, idx = torch.topk(scores, top_k)
-            xs, ys = xs[idx], ys[idx]
+    Built once per geometry via `get_engine()`; keeps the flattened coordinate
+    grid so per-request work is limited to the head outputs themselves.
+    """
 
-        centers = []
-        for x, y, s in zip(xs, ys, scores):
-            centers.append(torch.tensor([
-                (x.float() + 0.5) * stride,
-                (y.float() + 0.5) * stride,
-                s
-            ], device=ctr_logits.device))
+    def __init__(self, Hf: int, Wf: int, stride: int, device: torch.device):
+        self.Hf, self.Wf, self.stride, self.device = Hf, Wf, stride, device
+        yy, xx = torch.meshgrid(
+            torch.arange(Hf, device=device),
+            torch.arange(Wf, device=device),
+            indexing="ij"
+        )
+        self.coords = torch.stack([yy, xx], dim=-1).float().view(-1, 2)  # [Hf*Wf,2] (y,x)
+
+    def decode_centers(self, ctr_logits, params: PostprocessParams = PostprocessParams()):
+        """
+        ctr_logits : [B, 1, Hf, Wf]
+        returns    : list (per batch item) of [K, 3] tensors (x, y, score) in pixel space
+        """
+        B = ctr_logits.shape[0]
+        ctr_probs = torch.sigmoid(ctr_logits)
+
+        pooled = F.max_pool2d(
+            ctr_probs,
+            kernel_size=params.nms_kernel,
+            stride=1,
+            padding=params.nms_kernel // 2
+        )
+
+        keep = (ctr_probs == pooled) & (ctr_probs > params.prob_thresh)
+        decoded = []
+
+        for b in range(B):
+            idx = keep[b, 0].flatten().nonzero().squeeze(1)
+            scores = ctr_probs[b, 0].flatten()[idx]
+
+            if scores.numel() > params.top_k:
+                scores, sel = torch.topk(scores, params.top_k)
+                idx = idx[sel]
+
+            ys = torch.div(idx, self.Wf, rounding_mode="floor")
+            xs = idx - ys * self.Wf
+            decoded.append(torch.stack([
+                (xs.float() + 0.5) * self.stride,
+                (ys.float() + 0.5) * self.stride,
+                scores,
+            ], dim=1))
+
+        return decoded
+
+    def reconstruct_instances(self, sem_prob, ctr_points, offsets, params: PostprocessParams = PostprocessParams()):
+        """
+        sem_prob   : [Hf, Wf]  semantic probability
+        ctr_points : [K, 2|3] tensor or list of tensors [x,y] / [x,y,score] (pixel space)
+        offsets    : [2, Hf, Wf]
+        """
+        Hf, Wf = self.Hf, self.Wf
+        instance_map = torch.zeros(Hf * Wf, dtype=torch.int64, device=self.device)
+
+        if len(ctr_points) == 0:
+            return instance_map.view(Hf, Wf)
+
+        if not torch.is_tensor(ctr_points):
+            ctr_points = torch.stack([torch.as_tensor(c[:2], device=self.device).float() for c in ctr_points])
+        # (x, y) pixel space -> (y, x) feature coords
+        centers = torch.div(ctr_points[:, [1, 0]].float(), self.stride, rounding_mode="floor")  # [K,2]
+
+        # ---- semantic gate first: only foreground pixels need a distance ----
+        fg = (sem_prob > params.sem_thresh).flatten().nonzero().squeeze(1)
+        if fg.numel() == 0:
+            return instance_map.view(Hf, Wf)
+
+        # ---- apply offsets ----
+        shifted = self.coords[fg] + offsets.permute(1, 2, 0).reshape(-1, 2)[fg]
+
+        # ---- distance to centers + radius gate ----
+        min_dist, inst_ids = torch.cdist(shifted, centers).min(dim=1)
+        inst_ids = inst_ids + 1
+        inst_ids[min_dist > params.max_radius] = 0
+        instance_map[fg] = inst_ids
+
+        # ---- remove tiny instances ----
+        counts = torch.bincount(instance_map, minlength=len(centers) + 1)
+        tiny = counts < params.min_pixels
+        tiny[0] = False
+        instance_map[tiny[instance_map]] = 0
+
+        return instance_map.view(Hf, Wf)
+
+    @staticmethod
+    def count_instances(instance_map) -> int:
+        return int((torch.bincount(instance_map.flatten())[1:] > 0).sum().item())
+
+    def shelf_masks(self, sem_prob, params: PostprocessParams = PostprocessParams()):
+        return compute_shelf_masks(sem_prob, sem_thresh=params.sem_thresh, margin=params.margin)
+
+
+_engines: Dict[Tuple[int, int, int, str], PostprocessEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(Hf: int, Wf: int, stride: int, device) -> PostprocessEngine:
+    """Return the cached engine for this feature-map geometry, building it on first use."""
+    device = torch.device(device)
+    key = (Hf, Wf, stride, str(device))
+    engine = _engines.get(key)
+    cache_hit("postprocess_engine", engine is not None)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(key)
+            if engine is None:
+                engine = _engines[key] = PostprocessEngine(Hf, Wf, stride, device)
+    return engine
 
-        decoded.append(centers)
 
-    return decoded
+def decode_centers(ctr_logits, stride, prob_thresh=0.3, nms_kernel=3, top_k=200):
+    _, _, Hf, Wf = ctr_logits.shape
+    params = PostprocessParams(prob_thresh=prob_thresh, nms_kernel=nms_kernel, top_k=top_k)
+    return get_engine(Hf, Wf, stride, ctr_logits.device).decode_centers(ctr_logits, params)
 
 #========================================
 ## Radius-Gated Instance Reconstruction
@@ -53,63 +165,17 @@ def reconstruct_instances(
     offsets,
     sem_thresh=0.5,
     max_radius=16,     # <<< KEY FIX (feature-space pixels)
-    min_pixels=12     # remove tiny noisy instances
+    min_pixels=12,     # remove tiny noisy instances
+    stride=STRIDE,
 ):
     """
     sem_prob : [Hf, Wf]  semantic probability
-    ctr_points : list of tensors [x,y] or [x,y,score]
+    ctr_points : [K,3] tensor, or list of tensors [x,y] or [x,y,score]
     offsets : [2, Hf, Wf]
     """
-
     Hf, Wf = sem_prob.shape
-    device = sem_prob.device
-
-    if len(ctr_points) == 0:
-        return torch.zeros((Hf, Wf), dtype=torch.int64)
-
-    # ---- centers → tensor [K,2] in feature space ----
-    centers = []
-    for ctr in ctr_points:
-        x, y = ctr[:2]
-        centers.append([y // 4, x // 4])  # convert to feature coords
-
-    centers = torch.tensor(centers, device=device).float()  # [K,2]
-
-    # ---- pixel grid ----
-    yy, xx = torch.meshgrid(
-        torch.arange(Hf, device=device),
-        torch.arange(Wf, device=device),
-        indexing="ij"
-    )
-    coords = torch.stack([yy, xx], dim=-1).float()  # [Hf,Wf,2]
-
-    # ---- apply offsets ----
-    offsets = offsets.permute(1, 2, 0)  # [Hf,Wf,2]
-    shifted = coords + offsets
-
-    # ---- distance to centers ----
-    dist = torch.cdist(
-        shifted.view(-1, 2),
-        centers
-    )  # [Hf*Wf, K]
-
-    min_dist, inst_ids = dist.min(dim=1)
-    inst_ids = inst_ids.view(Hf, Wf) + 1
-
-    # ---- RADIUS GATE (THE FIX) ----
-    inst_ids[min_dist.view(Hf, Wf) > max_radius] = 0
-
-    # ---- semantic gate ----
-    instance_map = inst_ids * (sem_prob > sem_thresh)
-
-    # ---- remove tiny instances ----
-    for uid in instance_map.unique():
-        if uid == 0:
-            continue
-        if (instance_map == uid).sum() < min_pixels:
-            instance_map[instance_map == uid] = 0
-
-    return instance_map
+    params = PostprocessParams(sem_thresh=sem_thresh, max_radius=max_radius, min_pixels=min_pixels)
+    return get_engine(Hf, Wf, stride, sem_prob.device).reconstruct_instances(sem_prob, ctr_points, offsets, params)
 
 #==============================================
 # Shelf / Empty / Background Segmentation
@@ -0,0 +1,400 @@
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import torch
+from torch.profiler import ProfilerActivity, profile, record_function
+
+from app.core.config import settings
+from app.ml.registry import registry
+
+log = logging.getLogger("app.ml.profiling")
+
+
+# ============================================================
+# Module attribution
+# ============================================================
+
+class _ModuleRanges:
+    """
+    Forward hooks that open a profiler range per submodule, so operators in the
+    trace are nested under e.g. `backbone.cbam3.sa (SpatialAttention)`.
+    Installed lazily on the models a capture actually serves, removed when it ends.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._handles: List[Any] = []
+        self._models: List[torch.nn.Module] = []
+
+    def _stack(self) -> List[Any]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def install(self, model: torch.nn.Module) -> None:
+        """Hook `model` unless it already is (idempotent)."""
+        with self._lock:
+            if any(m is model for m in self._models):
+                return
+            self._models.append(model)
+            self._install_locked(model)
+
+    def _install_locked(self, model: torch.nn.Module) -> None:
+        for name, module in model.named_modules():
+            label = f"{name or 'model'} ({type(module).__name__})"
+
+            def pre(_m, _inp, label=label):
+                rf = record_function(label)
+                rf.__enter__()
+                self._stack().append(rf)
+
+            def post(_m, _inp, _out):
+                stack = self._stack()
+                if stack:
+                    stack.pop().__exit__(None, None, None)
+
+            self._handles.append(module.register_forward_pre_hook(pre))
+            self._handles.append(module.register_forward_hook(post))
+
+    def remove(self) -> None:
+        with self._lock:
+            for h in self._handles:
+                h.remove()
+            self._handles.clear()
+            self._models.clear()
+
+
+# ============================================================
+# Python sampling
+# ============================================================
+
+class _PySampler:
+    """Samples one thread's Python stack at a fixed interval (folded-stack output)."""
+
+    def __init__(self, thread_id: int, interval_s: float) -> None:
+        self.thread_id = thread_id
+        self.interval_s = interval_s
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="py-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_s):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def __enter__(self) -> "_PySampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+# ============================================================
+# Capture sessions
+# ============================================================
+
+@dataclass
+class ProfileCapture:
+    capture_id: str
+    out_dir: str
+    max_requests: Optional[int]
+    deadline: Optional[float]
+    python_sampling: bool
+    sample_interval_ms: float
+    started_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    # Requests that began profiling (claimed a slot) / finished and were recorded
+    claimed: int = 0
+    requests: int = 0
+    files: List[str] = field(default_factory=list)
+    # op/range name -> [calls, self_cpu_us, total_cpu_us, self_device_us]
+    ops: Dict[str, List[float]] = field(default_factory=dict)
+    py_stacks: Counter = field(default_factory=Counter)
+
+    @property
+    def done(self) -> bool:
+        if self.finished_at is not None:
+            return True
+        if self.max_requests is not None and self.requests >= self.max_requests:
+            return True
+        return self.deadline is not None and time.time() >= self.deadline
+
+    @property
+    def full(self) -> bool:
+        """No slot left for another request (some may still be in flight)."""
+        return self.max_requests is not None and self.claimed >= self.max_requests
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "capture_id": self.capture_id,
+            "out_dir": self.out_dir,
+            "max_requests": self.max_requests,
+            "deadline": self.deadline,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "requests": self.requests,
+            "files": list(self.files),
+        }
+
+
+class LiveProfiler:
+    """
+    Captures torch profiler traces (+ optional Python stack sampling) for the next
+    N requests or T seconds, whichever comes first. Idle cost is two attribute checks
+    per request.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._current: Optional[ProfileCapture] = None
+        self._last: Optional[ProfileCapture] = None
+        self._ranges = _ModuleRanges()
+        # Set from a signal handler; the next request starts the capture.
+        self._start_requested = False
+        # The torch profiler (kineto) supports one session per process: a request is
+        # profiled only while no other one is, overlapping requests run unprofiled.
+        self._profiling = False
+
+    def start_on_next_request(self) -> None:
+        """
+        Signal-safe: only sets a flag. A signal handler runs on the main thread between
+        bytecodes, possibly while that thread holds this profiler's or the registry's
+        lock, so it must not take either.
+        """
+        self._start_requested = True
+
+    def start(
+        self,
+        requests: Optional[int] = None,
+        seconds: Optional[float] = None,
+        python_sampling: bool = True,
+        sample_interval_ms: float = 5.0,
+    ) -> Dict[str, Any]:
+        if requests is None and seconds is None:
+            requests = settings.profile_default_requests
+        now = time.time()
+        # Millisecond timestamp sorts; the random suffix keeps same-millisecond captures apart.
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+        capture_id = f"{stamp}-{int(now * 1000) % 1000:03d}-{uuid.uuid4().hex[:6]}"
+        with self._lock:
+            finished = self._finish_if_done_locked()
+            if self._current is not None:
+                raise RuntimeError(f"Capture '{self._current.capture_id}' is already running.")
+            out_dir = os.path.join(settings.profile_dir, capture_id)
+            os.makedirs(out_dir, exist_ok=True)
+            self._current = ProfileCapture(
+                capture_id=capture_id,
+                out_dir=out_dir,
+                max_requests=requests,
+                deadline=time.time() + seconds if seconds is not None else None,
+                python_sampling=python_sampling,
+                sample_interval_ms=sample_interval_ms,
+            )
+            info = self._current.info()
+        if finished is not None:
+            self._write_summary(finished)
+        log.info("Profiling started: id=%s requests=%s seconds=%s", capture_id, requests, seconds)
+        return info
+
+    def _start_if_requested(self) -> None:
+        if not self._start_requested:
+            return
+        self._start_requested = False
+        try:
+            self.start()
+        except RuntimeError as e:
+            log.warning("Ignoring profiling signal: %s", e)
+
+    def _claim(self) -> Optional[Tuple[ProfileCapture, int]]:
+        """
+        Reserve a request slot in the running capture; None when there is nothing to
+        profile or another request is being profiled right now.
+        """
+        with self._lock:
+            cap = self._current
+            if cap is None or self._profiling:
+                return None
+            if cap.done or cap.full:
+                finished = self._finish_if_done_locked()
+                claim = None
+            else:
+                cap.claimed += 1
+                self._profiling = True
+                finished, claim = None, (cap, cap.claimed)
+        if finished is not None:
+            self._write_summary(finished)
+        return claim
+
+    @contextmanager
+    def capture(self) -> Iterator[None]:
+        """Wrap one request; profiles it if a capture is running, otherwise a no-op."""
+        if self._current is None and not self._start_requested:
+            yield
+            return
+        self._start_if_requested()
+        claim = self._claim()
+        if claim is None:
+            yield
+            return
+        cap, index = claim
+
+        try:
+            # Hook whatever this request can be served by, including models loaded or
+            # swapped in after the capture started (and the default model on first use).
+            try:
+                registry.ensure_default()
+            except Exception:
+                # The request's own lease retries the load and reports the error.
+                pass
+            with self._lock:
+                if self._current is cap:
+                    for entry in registry.loaded():
+                        self._ranges.install(entry.model)
+
+            activities = [ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(ProfilerActivity.CUDA)
+
+            sampler = _PySampler(threading.get_ident(), cap.sample_interval_ms / 1000.0) if cap.python_sampling else None
+            with profile(activities=activities, record_shapes=True) as prof:
+                if sampler is not None:
+                    with sampler:
+                        yield
+                else:
+                    yield
+        except BaseException:
+            # Failed requests aren't recorded; give the slot back to the next one.
+            with self._lock:
+                cap.claimed -= 1
+                self._profiling = False
+            raise
+        with self._lock:
+            self._profiling = False
+
+        if cap.finished_at is not None:
+            return
+        # File I/O and aggregation happen outside the lock; only the merge is locked.
+        path = os.path.join(cap.out_dir, f"request_{index:03d}.trace.json")
+        prof.export_chrome_trace(path)
+        ops = self._op_totals(prof)
+        with self._lock:
+            accepted = self._current is cap and cap.finished_at is None
+            if accepted:
+                cap.requests += 1
+                cap.files.append(path)
+                for key, row in ops.items():
+                    acc = cap.ops.setdefault(key, [0, 0.0, 0.0, 0.0])
+                    for i, v in enumerate(row):
+                        acc[i] += v
+                if sampler is not None:
+                    cap.py_stacks.update(sampler.stacks)
+                finished = self._finish_if_done_locked()
+        if not accepted:
+            # Stopped while this request was running
+            os.remove(path)
+        elif finished is not None:
+            self._write_summary(finished)
+
+    @staticmethod
+    def _op_totals(prof: profile) -> Dict[str, List[float]]:
+        return {
+            evt.key: [evt.count, evt.self_cpu_time_total, evt.cpu_time_total,
+                      getattr(evt, "self_device_time_total", 0.0)]
+            for evt in prof.key_averages()
+        }
+
+    def _finish_if_done_locked(self) -> Optional[ProfileCapture]:
+        """Finish a capture that hit its limit; the caller writes its summary after unlocking."""
+        if self._current is not None and self._current.done:
+            return self._finish_locked()
+        return None
+
+    def _finish_locked(self) -> ProfileCapture:
+        cap = self._current
+        cap.finished_at = time.time()
+        self._ranges.remove()
+        self._current, self._last = None, cap
+        log.info("Profiling finished: id=%s requests=%d dir=%s", cap.capture_id, cap.requests, cap.out_dir)
+        return cap
+
+    @staticmethod
+    def _write_summary(cap: ProfileCapture, top: int = 30) -> None:
+        by_total = sorted(cap.ops.items(), key=lambda kv: kv[1][2], reverse=True)
+        by_self = sorted(cap.ops.items(), key=lambda kv: kv[1][1], reverse=True)
+        # Leaf Python frames (where samples were taken) are the self-time hot spots.
+        py_leaf: Counter = Counter()
+        for stack, n in cap.py_stacks.items():
+            py_leaf[stack.rsplit(";", 1)[-1]] += n
+
+        def rows(items):
+            return [
+                {"name": k, "calls": int(v[0]), "self_cpu_ms": v[1] / 1000, "total_cpu_ms": v[2] / 1000,
+                 "self_device_ms": v[3] / 1000}
+                for k, v in items[:top]
+            ]
+
+        summary = {
+            **cap.info(),
+            "top_by_total_cpu": rows(by_total),
+            "top_by_self_cpu": rows(by_self),
+            "python_top_frames": [{"frame": k, "samples": n} for k, n in py_leaf.most_common(top)],
+        }
+        with open(os.path.join(cap.out_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+        lines = [f"ShelfScout profile {cap.capture_id} — {cap.requests} request(s)", ""]
+        lines.append(f"{'name':<60} {'calls':>7} {'total ms':>11} {'self ms':>11}")
+        for r in rows(by_total):
+            lines.append(f"{r['name'][:60]:<60} {r['calls']:>7} {r['total_cpu_ms']:>11.2f} {r['self_cpu_ms']:>11.2f}")
+        if py_leaf:
+            lines += ["", "Python samples (leaf frames)"]
+            lines += [f"{n:>7}  {k}" for k, n in py_leaf.most_common(top)]
+        with open(os.path.join(cap.out_dir, "summary.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        if cap.py_stacks:
+            with open(os.path.join(cap.out_dir, "python.folded"), "w", encoding="utf-8") as f:
+                for stack, n in cap.py_stacks.most_common():
+                    f.write(f"{stack} {n}\n")
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if self._current is None:
+                return None
+            cap = self._finish_locked()
+        self._write_summary(cap)
+        return cap.info()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            finished = self._finish_if_done_locked()
+            status = {
+                "running": self._current.info() if self._current else None,
+                "last": self._last.info() if self._last else None,
+            }
+        if finished is not None:
+            self._write_summary(finished)
+        return status
+
+
+profiler = LiveProfiler()
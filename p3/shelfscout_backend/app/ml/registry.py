@@ -0,0 +1,316 @@
+from __future__ import annotations
+
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+import torch
+
+from app.core.config import settings
+from app.ml.device import get_device
+from app.ml.model import ShelfScoutPanopticCNN
+from app.ml.stub import build_stub_model
+
+log = logging.getLogger("app.ml.registry")
+
+
+def load_checkpoint(ckpt_path: str, device: torch.device) -> ShelfScoutPanopticCNN:
+    """
+    Build the model and load weights from a {"model_state": ..., "arch": {...}} checkpoint.
+    Checkpoints without "arch" use BACKBONE / FPN_CHANNELS.
+    """
+    try:
+        ckpt = torch.load(ckpt_path, map_location=device)
+    except FileNotFoundError as e:
+        raise FileNotFoundError(
+            f"Checkpoint not found at '{ckpt_path}'. "
+            f"Place it there or set MODEL_PATH to the correct path."
+        ) from e
+
+    if "model_state" not in ckpt:
+        raise KeyError("Checkpoint missing key 'model_state'.")
+
+    arch = ckpt.get("arch") or {"backbone": settings.backbone, "fpn_channels": settings.fpn_channels}
+    model = ShelfScoutPanopticCNN(**arch).to(device)
+    model.load_state_dict(ckpt["model_state"])
+    model.eval()
+    return model
+
+
+def warmup(model: torch.nn.Module, device: torch.device, image_size: int) -> None:
+    """Run one dummy forward pass so the first real request doesn't pay for lazy init."""
+    with torch.no_grad():
+        model(torch.zeros((1, 3, image_size, image_size), device=device))
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def default_version_label(ckpt_path: str) -> str:
+    if settings.model_version:
+        return settings.model_version
+    if settings.model_backend == "stub":
+        return "stub"
+    return os.path.splitext(os.path.basename(ckpt_path))[0]
+
+
+class UnknownModelVersion(KeyError):
+    """Raised when a request or admin call names a version that is not loaded."""
+
+
+@dataclass
+class ModelVersion:
+    version: str
+    path: str
+    model: torch.nn.Module
+    device: torch.device
+    loaded_at: float = field(default_factory=time.time)
+    inflight: int = 0
+    served: int = 0
+    retired: bool = False
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "path": self.path,
+            "device": str(self.device),
+            "arch": getattr(self.model, "arch", None),
+            "loaded_at": self.loaded_at,
+            "inflight": self.inflight,
+            "served": self.served,
+            "retired": self.retired,
+        }
+
+
+class ModelRegistry:
+    """
+    Holds every loaded model version and decides which one serves a request.
+
+    - `active` serves all traffic not routed to the candidate.
+    - `candidate` (optional) receives `candidate_pct` percent of traffic for A/B comparison.
+    - Replaced versions are retired and dropped once their in-flight requests finish.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._versions: Dict[str, ModelVersion] = {}
+        self._active: Optional[str] = None
+        self._candidate: Optional[str] = None
+        self._candidate_pct: float = 0.0
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._default_lock = threading.Lock()
+
+    # ------------------------------------------------------------------
+    # Loading
+    # ------------------------------------------------------------------
+
+    def _build(self, version: str, path: str) -> ModelVersion:
+        device = get_device()
+        t0 = time.perf_counter()
+        if settings.model_backend == "stub":
+            model = build_stub_model(device)
+        elif settings.model_backend == "torch":
+            model = load_checkpoint(path, device)
+        else:
+            raise ValueError("MODEL_BACKEND must be one of: torch, stub")
+        if settings.model_warmup:
+            warmup(model, device, settings.image_size)
+        log.info(
+            "Model loaded. version=%s device=%s path=%s (%.0f ms)",
+            version, device, path, (time.perf_counter() - t0) * 1000,
+        )
+        return ModelVersion(version=version, path=path, model=model, device=device)
+
+    def _register(
+        self,
+        entry: ModelVersion,
+        activate: bool,
+        candidate_pct: Optional[float],
+    ) -> None:
+        with self._lock:
+            old = self._versions.get(entry.version)
+            if old is not None and old is not entry:
+                old.retired = True
+            self._versions[entry.version] = entry
+            if activate or self._active is None:
+                self._switch_active_locked(entry.version)
+            elif candidate_pct is not None:
+                self._set_candidate_locked(entry.version, candidate_pct)
+            if old is not None:
+                self._drop_if_drained_locked(old)
+
+    def ensure_default(self) -> ModelVersion:
+        """Synchronously load MODEL_PATH if nothing is active yet (first request)."""
+        with self._lock:
+            if self._active is not None:
+                return self._versions[self._active]
+        # Serialize concurrent first requests so the checkpoint is only loaded once.
+        with self._default_lock:
+            with self._lock:
+                if self._active is not None:
+                    return self._versions[self._active]
+            path = settings.model_path
+            entry = self._build(default_version_label(path), path)
+            self._register(entry, activate=True, candidate_pct=None)
+            return entry
+
+    def load(
+        self,
+        path: str,
+        version: Optional[str] = None,
+        activate: bool = True,
+        candidate_pct: Optional[float] = None,
+        background: bool = True,
+    ) -> str:
+        """
+        Load and warm a checkpoint, then either make it active or route
+        `candidate_pct` percent of traffic to it. Returns the version label.
+        With background=True this returns immediately; poll `status()` for progress.
+        """
+        version = version or default_version_label(path)
+        if candidate_pct is not None and not 0.0 <= candidate_pct <= 100.0:
+            raise ValueError("traffic_pct must be within [0, 100].")
+        with self._lock:
+            job = self._jobs.get(version)
+            if job is not None and job["state"] == "loading":
+                raise RuntimeError(f"Version '{version}' is already loading.")
+            self._jobs[version] = {"state": "loading", "path": path, "started_at": time.time(), "error": None}
+
+        def _run() -> None:
+            try:
+                entry = self._build(version, path)
+                self._register(entry, activate=activate, candidate_pct=candidate_pct)
+            except Exception as e:
+                log.exception("Loading model version %s failed.", version)
+                with self._lock:
+                    self._jobs[version].update(state="failed", error=f"{type(e).__name__}: {e}")
+                if not background:
+                    raise
+                return
+            with self._lock:
+                self._jobs[version].update(state="ready", finished_at=time.time())
+
+        if background:
+            threading.Thread(target=_run, name=f"model-load-{version}", daemon=True).start()
+        else:
+            _run()
+        return version
+
+    # ------------------------------------------------------------------
+    # Traffic routing
+    # ------------------------------------------------------------------
+
+    def _require_locked(self, version: str) -> ModelVersion:
+        entry = self._versions.get(version)
+        if entry is None or entry.retired:
+            raise UnknownModelVersion(f"Unknown model version '{version}'.")
+        return entry
+
+    def _drop_if_drained_locked(self, entry: ModelVersion) -> None:
+        if entry.retired and entry.inflight == 0 and self._versions.get(entry.version) is entry:
+            del self._versions[entry.version]
+            log.info("Model version %s drained and unloaded.", entry.version)
+
+    def _retire_locked(self, version: Optional[str]) -> None:
+        if version is None or version in (self._active, self._candidate):
+            return
+        entry = self._versions.get(version)
+        if entry is not None:
+            entry.retired = True
+            self._drop_if_drained_locked(entry)
+
+    def _switch_active_locked(self, version: str) -> None:
+        self._require_locked(version)
+        previous = self._active
+        self._active = version
+        if self._candidate == version:
+            self._candidate, self._candidate_pct = None, 0.0
+        if previous != version:
+            log.info("Active model switched %s -> %s", previous, version)
+            self._retire_locked(previous)
+
+    def _set_candidate_locked(self, version: str, pct: float) -> None:
+        if not 0.0 <= pct <= 100.0:
+            raise ValueError("traffic_pct must be within [0, 100].")
+        self._require_locked(version)
+        if version == self._active:
+            raise ValueError("Candidate must differ from the active version.")
+        previous = self._candidate
+        self._candidate, self._candidate_pct = version, float(pct)
+        if previous != version:
+            self._retire_locked(previous)
+
+    def activate(self, version: str) -> None:
+        with self._lock:
+            self._switch_active_locked(version)
+
+    def set_candidate(self, version: str, traffic_pct: float) -> None:
+        with self._lock:
+            self._set_candidate_locked(version, traffic_pct)
+
+    def clear_candidate(self) -> None:
+        with self._lock:
+            previous = self._candidate
+            self._candidate, self._candidate_pct = None, 0.0
+            self._retire_locked(previous)
+
+    def unload(self, version: str) -> None:
+        with self._lock:
+            if version == self._active:
+                raise ValueError("Cannot unload the active version; activate another one first.")
+            if version == self._candidate:
+                self._candidate, self._candidate_pct = None, 0.0
+            self._require_locked(version)
+            self._retire_locked(version)
+
+    def _pick_locked(self, version: Optional[str]) -> ModelVersion:
+        if version is not None:
+            return self._require_locked(version)
+        if self._candidate is not None and random.random() * 100.0 < self._candidate_pct:
+            return self._versions[self._candidate]
+        return self._versions[self._active]
+
+    @contextmanager
+    def lease(self, version: Optional[str] = None) -> Iterator[ModelVersion]:
+        """
+        Pin a model version for the duration of one request. A version that is
+        switched out mid-request stays loaded until every lease on it is released.
+        """
+        if version is None:
+            self.ensure_default()
+        with self._lock:
+            entry = self._pick_locked(version)
+            entry.inflight += 1
+            entry.served += 1
+        try:
+            yield entry
+        finally:
+            with self._lock:
+                entry.inflight -= 1
+                self._drop_if_drained_locked(entry)
+
+    def loaded(self) -> List[ModelVersion]:
+        with self._lock:
+            return list(self._versions.values())
+
+    def active(self) -> ModelVersion:
+        self.ensure_default()
+        with self._lock:
+            return self._versions[self._active]
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "active": self._active,
+                "candidate": self._candidate,
+                "candidate_pct": self._candidate_pct,
+                "versions": [v.info() for v in self._versions.values()],
+                "jobs": {k: dict(v) for k, v in self._jobs.items()},
+            }
+
+
+registry = ModelRegistry()
@@ -0,0 +1,120 @@
+"""
+Stand-in for ShelfScoutPanopticCNN used with MODEL_BACKEND=stub.
+
+It sleeps for a configurable "forward" latency and returns synthetic head outputs,
+so the real preprocessing and post-processing run on every request without a
+checkpoint. Meant for load testing and capacity planning (benchmarks/loadtest.py).
+"""
+from __future__ import annotations
+
+import random
+import threading
+import time
+from typing import Dict, Sequence, Tuple
+
+import torch
+
+from app.core.config import settings
+from app.ml.model import ShelfScoutPanopticCNN
+
+
+def synthetic_head_outputs(
+    feat_size: int,
+    n_centers: int,
+    seed: int = 0,
+    batch: int = 1,
+) -> Dict[str, torch.Tensor]:
+    """
+    Head outputs with `n_centers` well-separated center peaks, product blobs around
+    them in the semantic map and offsets pointing at the owning center.
+    """
+    g = torch.Generator().manual_seed(seed)
+    Hf = Wf = feat_size
+    cy = torch.randint(2, Hf - 2, (n_centers,), generator=g).float()
+    cx = torch.randint(2, Wf - 2, (n_centers,), generator=g).float()
+
+    yy, xx = torch.meshgrid(torch.arange(Hf).float(), torch.arange(Wf).float(), indexing="ij")
+    d2 = (yy[..., None] - cy) ** 2 + (xx[..., None] - cx) ** 2  # [Hf,Wf,K]
+    nearest_d2, nearest = d2.min(dim=-1)
+
+    ctr_prob = torch.exp(-nearest_d2 / 2.0).clamp(1e-4, 1 - 1e-4)
+    ctr_logits = torch.log(ctr_prob / (1 - ctr_prob))[None, None]
+
+    fg = (nearest_d2 < 36.0).float()
+    sem_logits = torch.stack([-(fg * 4 - 2), fg * 4 - 2])[None]
+
+    offsets = torch.stack([cy[nearest] - yy, cx[nearest] - xx])[None]
+
+    return {
+        "sem_logits": sem_logits.repeat(batch, 1, 1, 1),
+        "ctr_logits": ctr_logits.repeat(batch, 1, 1, 1),
+        "offsets": offsets.repeat(batch, 1, 1, 1),
+    }
+
+
+class StubPanopticModel(torch.nn.Module):
+    """
+    Same call signature and output shapes as ShelfScoutPanopticCNN. A forward pass
+    takes latency_ms (+ per_image_ms for every image after the first in a batch,
+    +- uniform jitter_ms). The sleep releases the GIL like real torch kernels do.
+    """
+
+    HEADS = ShelfScoutPanopticCNN.HEADS
+
+    def __init__(
+        self,
+        latency_ms: float = 50.0,
+        per_image_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        n_centers: int = 30,
+        stride: int = 4,
+    ):
+        super().__init__()
+        self.latency_ms = latency_ms
+        self.per_image_ms = per_image_ms
+        self.jitter_ms = jitter_ms
+        self.n_centers = n_centers
+        self.stride = stride
+        self.arch = {
+            "backbone": "stub",
+            "latency_ms": latency_ms,
+            "per_image_ms": per_image_ms,
+            "jitter_ms": jitter_ms,
+        }
+        # Synthetic outputs are read-only downstream, so one set per (feature size, batch) is reused.
+        self._outputs: Dict[Tuple[int, int], Dict[str, torch.Tensor]] = {}
+        self._lock = threading.Lock()
+
+    def _synthetic(self, feat: int, batch: int) -> Dict[str, torch.Tensor]:
+        key = (feat, batch)
+        with self._lock:
+            if key not in self._outputs:
+                self._outputs[key] = synthetic_head_outputs(feat, self.n_centers, batch=batch)
+            return self._outputs[key]
+
+    def forward(self, x: torch.Tensor, heads: Sequence[str] = HEADS):
+        batch = x.shape[0]
+        delay_ms = self.latency_ms + self.per_image_ms * (batch - 1)
+        if self.jitter_ms:
+            delay_ms += random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000.0)
+
+        out = self._synthetic(x.shape[-1] // self.stride, batch)
+        out = {name: t.to(x.device) for name, t in out.items()}
+        return (
+            out["sem_logits"] if "sem" in heads else None,
+            out["ctr_logits"] if "ctr" in heads else None,
+            out["offsets"] if "off" in heads else None,
+        )
+
+
+def build_stub_model(device: torch.device) -> StubPanopticModel:
+    """Stub configured from STUB_* settings."""
+    return StubPanopticModel(
+        latency_ms=settings.stub_latency_ms,
+        per_image_ms=settings.stub_per_image_ms,
+        jitter_ms=settings.stub_jitter_ms,
+        n_centers=settings.stub_centers,
+        stride=settings.stride,
+    ).to(device).eval()
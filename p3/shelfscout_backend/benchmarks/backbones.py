@@ -0,0 +1,117 @@
+"""
+Latency / size trade-off of ShelfScoutPanopticCNN backbones.
+
+Times a randomly initialized model per (backbone, fpn_channels) at each image
+size; no checkpoint needed. With --teacher/--students/--images it also reports
+each distilled student's agreement with the teacher (see app/ml/distill.py).
+
+Usage (from shelfscout_backend/):
+
+    python -m benchmarks.backbones --out backbones.json
+    python -m benchmarks.backbones --backbones resnet50,mobilenet_v3_large --fpn-channels 256,128
+    python -m benchmarks.backbones --teacher checkpoints/shelfscout_latest.pth \
+        --students checkpoints/shelfscout_mnv3.pth --images data/holdout
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+import torch
+from torch.utils.data import DataLoader
+
+from app.ml.model import BACKBONES, ShelfScoutPanopticCNN
+from benchmarks.hotpaths import _ints, time_fn
+
+
+def _names(s: str) -> List[str]:
+    return [v.strip() for v in s.split(",") if v.strip()]
+
+
+def run(
+    backbones: Sequence[str],
+    fpn_channels: Sequence[int],
+    image_sizes: Sequence[int],
+    repeats: int,
+    warmup: int,
+    device: torch.device,
+) -> List[Dict[str, Any]]:
+    rows = []
+    for name in backbones:
+        for fpn in fpn_channels:
+            torch.manual_seed(0)
+            model = ShelfScoutPanopticCNN(backbone=name, fpn_channels=fpn).to(device).eval()
+            params_m = sum(p.numel() for p in model.parameters()) / 1e6
+            for size in image_sizes:
+                x = torch.rand((1, 3, size, size), device=device)
+
+                def forward(x=x, heads=ShelfScoutPanopticCNN.HEADS):
+                    with torch.no_grad():
+                        model(x, heads=heads)
+
+                full = time_fn(forward, device, repeats, warmup)
+                sem = time_fn(lambda: forward(heads=("sem",)), device, repeats, warmup)
+                row = {
+                    "backbone": name,
+                    "fpn_channels": fpn,
+                    "image_size": size,
+                    "params_m": round(params_m, 2),
+                    "forward_ms": full["median_ms"],
+                    "forward_sem_only_ms": sem["median_ms"],
+                }
+                rows.append(row)
+                print(
+                    f"{name:<20} fpn={fpn:<4} {size:>4}px {params_m:6.1f}M "
+                    f"forward={full['median_ms']:8.1f} ms  sem-only={sem['median_ms']:8.1f} ms",
+                    file=sys.stderr,
+                )
+            del model
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--backbones", type=_names, default=list(BACKBONES))
+    ap.add_argument("--fpn-channels", type=_ints, default=[256, 128])
+    ap.add_argument("--image-sizes", type=_ints, default=[512])
+    ap.add_argument("--repeats", type=int, default=5)
+    ap.add_argument("--warmup", type=int, default=1)
+    ap.add_argument("--device", default="cpu")
+    ap.add_argument("--teacher", help="Teacher checkpoint for the agreement report")
+    ap.add_argument("--students", type=_names, default=[], help="Student checkpoints to compare")
+    ap.add_argument("--images", help="Held-out images for the agreement report")
+    ap.add_argument("--out", help="Write results JSON here (default: stdout)")
+    args = ap.parse_args(argv)
+
+    device = torch.device(args.device)
+    report: Dict[str, Any] = {
+        "torch": torch.__version__,
+        "device": str(device),
+        "threads": torch.get_num_threads(),
+        "latency": run(args.backbones, args.fpn_channels, args.image_sizes, args.repeats, args.warmup, device),
+    }
+
+    if args.teacher and args.students and args.images:
+        from app.ml.distill import ShelfImageFolder, evaluate_agreement
+        from app.ml.registry import load_checkpoint
+
+        teacher = load_checkpoint(args.teacher, device)
+        loader = DataLoader(ShelfImageFolder(args.images, args.image_sizes[0]), batch_size=4)
+        report["agreement"] = []
+        for path in args.students:
+            student = load_checkpoint(path, device)
+            report["agreement"].append({"checkpoint": path, **evaluate_agreement(teacher, student, loader)})
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,117 @@
+"""
+Query latency of the history store (app/core/history.py) at scale.
+
+Fills a fresh SQLite file with `--rows` synthetic results spread over
+`--stores` x `--shelves` shelves and `--days` days, then times the queries
+behind the /history endpoints.
+
+Usage (from shelfscout_backend/):
+
+    python -m benchmarks.history --rows 1000000 --db /tmp/history_bench.db
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import torch
+
+from app.core.history import HistoryStore
+from benchmarks.hotpaths import time_fn
+
+CPU = torch.device("cpu")
+
+
+def fill(store: HistoryStore, rows: int, stores: int, shelves: int, days: float, batch: int = 10_000) -> float:
+    """Insert `rows` results in time order; returns the last timestamp."""
+    rng = random.Random(0)
+    t0 = 1_700_000_000.0
+    step = days * 86_400.0 / rows
+    ratio: Dict[tuple, float] = {}
+    for offset in range(0, rows, batch):
+        records = []
+        for i in range(offset, min(rows, offset + batch)):
+            key = (f"store{rng.randrange(stores)}", f"shelf{rng.randrange(shelves)}")
+            # Slow random walk per shelf so trends look like restock cycles
+            r = min(1.0, max(0.0, ratio.get(key, 0.1) + rng.uniform(-0.05, 0.06)))
+            ratio[key] = 0.05 if r > 0.8 else r
+            records.append({
+                "store_id": key[0],
+                "shelf_id": key[1],
+                "camera_id": "cam0",
+                "ts": t0 + i * step,
+                "result": {
+                    "empty_ratio": r,
+                    "predicted_instances": rng.randrange(5, 120),
+                    "shelf_bbox": [2, 120, 3, 125],
+                    "model_version": "bench",
+                },
+            })
+        store.record_many(records)
+    return t0 + rows * step
+
+
+def run(db: str, rows: int, stores: int, shelves: int, days: float, repeats: int) -> Dict[str, Any]:
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db + suffix):
+            os.remove(db + suffix)
+    store = HistoryStore(db)
+
+    t = time.perf_counter()
+    now = fill(store, rows, stores, shelves, days)
+    fill_s = time.perf_counter() - t
+    print(f"filled {rows} rows in {fill_s:.1f} s ({rows / fill_s:,.0f} rows/s)", file=sys.stderr)
+
+    cases = {
+        "shelf_range_1d": lambda: store.range("store0", "shelf0", start=now - 86_400, end=now),
+        "shelf_latest_100": lambda: store.range("store0", "shelf0", limit=100, newest_first=True),
+        "shelf_trend_7d_hourly": lambda: store.trend("store0", "shelf0", now - 7 * 86_400, now, 3600.0, window=6),
+        "shelf_trend_all_daily": lambda: store.trend("store0", "shelf0", now - days * 86_400, now, 86_400.0, window=7),
+        "alerts_all_stores": lambda: store.above_threshold(0.5),
+        "alerts_one_store": lambda: store.above_threshold(0.5, store_id="store1"),
+        "all_shelves_last_hour": lambda: store.range(start=now - 3600, end=now, limit=1000),
+        "record_one": lambda: store.record("store0", "shelf0", {"empty_ratio": 0.2}, ts=now),
+    }
+    results: List[Dict[str, Any]] = []
+    for name, fn in cases.items():
+        n = len(fn()) if name != "record_one" else 1
+        stats = time_fn(fn, CPU, repeats, warmup=2)
+        results.append({"query": name, "rows_returned": n, **stats})
+        print(f"{name:<24} rows={n:<6} median={stats['median_ms']:8.3f} ms p90={stats['p90_ms']:8.3f} ms",
+              file=sys.stderr)
+    store.close()
+    return {
+        "meta": {"rows": rows, "stores": stores, "shelves_per_store": shelves, "days": days,
+                 "fill_seconds": fill_s, "db_bytes": os.path.getsize(db)},
+        "results": results,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--db", default="history_bench.db")
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--stores", type=int, default=50)
+    ap.add_argument("--shelves", type=int, default=40, help="Shelves per store")
+    ap.add_argument("--days", type=float, default=90.0)
+    ap.add_argument("--repeats", type=int, default=50)
+    ap.add_argument("--out", help="Write results JSON here (default: stdout)")
+    args = ap.parse_args(argv)
+
+    report = run(args.db, args.rows, args.stores, args.shelves, args.days, args.repeats)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
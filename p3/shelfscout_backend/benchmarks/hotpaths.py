@@ -0,0 +1,277 @@
+"""
+Micro-benchmarks for the inference and post-processing hot paths.
+
+Uses a randomly initialized ShelfScoutPanopticCNN and synthetic shelf-like
+inputs, so no checkpoint is needed. Each stage is timed on its own:
+
+    preprocess, forward, forward_sem_only, decode_centers, reconstruct_instances,
+    compute_shelf_masks, mask_encode
+
+Usage (from shelfscout_backend/):
+
+    python -m benchmarks.hotpaths --out bench.json
+    python -m benchmarks.hotpaths --save-baseline benchmarks/baseline.json
+    python -m benchmarks.hotpaths --baseline benchmarks/baseline.json --tolerance 0.15
+
+Exits with status 1 when any stage is slower than the baseline by more than
+`--tolerance` (relative) and `--min-delta-ms` (absolute).
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+from PIL import Image
+
+from app.ml.inference import _mask_to_base64_png, preprocess_image_bytes
+from app.ml.model import ShelfScoutPanopticCNN
+from app.ml.postprocess import compute_shelf_masks, decode_centers, reconstruct_instances
+from app.ml.stub import synthetic_head_outputs
+
+# ============================================================
+# Synthetic inputs
+# ============================================================
+
+
+def synthetic_shelf_image(width: int, height: int, seed: int = 0, empty_frac: float = 0.25) -> bytes:
+    """JPEG bytes of a shelf-like scene: horizontal shelves filled with product boxes and gaps."""
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 235, dtype=np.uint8)
+    n_shelves = 4
+    shelf_h = height // n_shelves
+    for s in range(n_shelves):
+        y0 = s * shelf_h
+        img[y0 + shelf_h - 8: y0 + shelf_h, :] = (90, 70, 50)  # shelf board
+        x = 4
+        while x < width - 8:
+            w = int(rng.integers(max(8, width // 40), max(9, width // 12)))
+            if rng.random() >= empty_frac:
+                h = int(rng.integers(shelf_h // 2, shelf_h - 12))
+                color = rng.integers(30, 220, size=3)
+                img[y0 + shelf_h - 8 - h: y0 + shelf_h - 8, x: min(width, x + w)] = color
+            x += w + 2
+    buf = io.BytesIO()
+    Image.fromarray(img).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+# ============================================================
+# Timing
+# ============================================================
+
+
+def _sync(device: torch.device) -> None:
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+
+
+def time_fn(fn: Callable[[], Any], device: torch.device, repeats: int, warmup: int) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    _sync(device)
+    samples: List[float] = []
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        _sync(device)
+        samples.append((time.perf_counter() - t0) * 1000.0)
+    samples.sort()
+    return {
+        "median_ms": statistics.median(samples),
+        "mean_ms": statistics.fmean(samples),
+        "min_ms": samples[0],
+        "p90_ms": samples[min(len(samples) - 1, int(round(0.9 * (len(samples) - 1))))],
+        "repeats": repeats,
+    }
+
+
+def run(
+    image_sizes: Sequence[int],
+    batch_sizes: Sequence[int],
+    center_counts: Sequence[int],
+    stride: int,
+    repeats: int,
+    warmup: int,
+    device: torch.device,
+    skip_forward: bool = False,
+) -> Dict[str, Any]:
+    torch.manual_seed(0)
+    results: List[Dict[str, Any]] = []
+
+    def record(stage: str, params: Dict[str, Any], fn: Callable[[], Any], reps: int = repeats) -> None:
+        stats = time_fn(fn, device, reps, warmup)
+        results.append({"stage": stage, "params": params, **stats})
+        print(f"{stage:<22} {json.dumps(params):<48} median={stats['median_ms']:9.2f} ms", file=sys.stderr)
+
+    model: Optional[ShelfScoutPanopticCNN] = None
+    if not skip_forward:
+        model = ShelfScoutPanopticCNN().to(device).eval()
+
+    raw = synthetic_shelf_image(1280, 960)
+
+    for size in image_sizes:
+        record("preprocess", {"image_size": size}, lambda: preprocess_image_bytes(raw, size))
+
+        if model is not None:
+            for bs in batch_sizes:
+                x = torch.rand((bs, 3, size, size), device=device)
+
+                def forward(x=x):
+                    with torch.no_grad():
+                        model(x)
+
+                record("forward", {"image_size": size, "batch": bs}, forward, reps=max(1, repeats // 4))
+
+                def forward_sem_only(x=x):
+                    with torch.no_grad():
+                        model(x, heads=("sem",))
+
+                # Summary-only requests (e.g. fields=empty_ratio) skip the center/offset heads.
+                record("forward_sem_only", {"image_size": size, "batch": bs}, forward_sem_only, reps=max(1, repeats // 4))
+
+        feat = size // stride
+        for k in center_counts:
+            for bs in batch_sizes:
+                heads = {n: t.to(device) for n, t in synthetic_head_outputs(feat, k, batch=bs).items()}
+                record(
+                    "decode_centers",
+                    {"image_size": size, "batch": bs, "centers": k},
+                    lambda h=heads: decode_centers(h["ctr_logits"], stride=stride, top_k=max(200, k)),
+                )
+
+            heads = {n: t.to(device) for n, t in synthetic_head_outputs(feat, k).items()}
+            sem_prob = torch.softmax(heads["sem_logits"][0], dim=0)[1]
+            centers = decode_centers(heads["ctr_logits"], stride=stride, top_k=max(200, k))[0]
+            record(
+                "reconstruct_instances",
+                {"image_size": size, "centers": k},
+                lambda: reconstruct_instances(
+                    sem_prob=sem_prob, ctr_points=centers, offsets=heads["offsets"][0], stride=stride
+                ),
+            )
+
+        heads = {n: t.to(device) for n, t in synthetic_head_outputs(feat, center_counts[-1]).items()}
+        sem_prob = torch.softmax(heads["sem_logits"][0], dim=0)[1]
+        record("compute_shelf_masks", {"image_size": size}, lambda: compute_shelf_masks(sem_prob))
+
+        product_mask = compute_shelf_masks(sem_prob)[0]
+        record("mask_encode", {"image_size": size}, lambda: _mask_to_base64_png(product_mask, size))
+
+    return {
+        "meta": {
+            "torch": torch.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "device": str(device),
+            "threads": torch.get_num_threads(),
+            "stride": stride,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+
+
+# ============================================================
+# Baseline comparison
+# ============================================================
+
+
+def _key(r: Dict[str, Any]) -> str:
+    return r["stage"] + json.dumps(r["params"], sort_keys=True)
+
+
+def compare(
+    current: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float,
+    min_delta_ms: float,
+) -> List[Dict[str, Any]]:
+    """Return one row per stage present in both runs; `regression` marks slowdowns beyond the thresholds."""
+    base = {_key(r): r for r in baseline["results"]}
+    rows = []
+    for r in current["results"]:
+        b = base.get(_key(r))
+        if b is None:
+            continue
+        delta = r["median_ms"] - b["median_ms"]
+        ratio = r["median_ms"] / b["median_ms"] if b["median_ms"] > 0 else float("inf")
+        rows.append({
+            "stage": r["stage"],
+            "params": r["params"],
+            "baseline_ms": b["median_ms"],
+            "current_ms": r["median_ms"],
+            "ratio": ratio,
+            "regression": ratio > 1.0 + tolerance and delta > min_delta_ms,
+        })
+    return rows
+
+
+def _ints(s: str) -> List[int]:
+    return [int(v) for v in s.split(",") if v.strip()]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--image-sizes", type=_ints, default=[256, 512])
+    ap.add_argument("--batch-sizes", type=_ints, default=[1, 4])
+    ap.add_argument("--centers", type=_ints, default=[10, 50, 200])
+    ap.add_argument("--stride", type=int, default=4)
+    ap.add_argument("--repeats", type=int, default=20)
+    ap.add_argument("--warmup", type=int, default=2)
+    ap.add_argument("--device", default="cpu")
+    ap.add_argument("--skip-forward", action="store_true", help="Only time preprocessing and post-processing")
+    ap.add_argument("--out", help="Write results JSON here (default: stdout)")
+    ap.add_argument("--save-baseline", help="Write results JSON as the new baseline")
+    ap.add_argument("--baseline", help="Compare against this baseline JSON")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown (0.15 = 15%%)")
+    ap.add_argument("--min-delta-ms", type=float, default=0.5, help="Ignore slowdowns smaller than this")
+    args = ap.parse_args(argv)
+
+    report = run(
+        image_sizes=args.image_sizes,
+        batch_sizes=args.batch_sizes,
+        center_counts=args.centers,
+        stride=args.stride,
+        repeats=args.repeats,
+        warmup=args.warmup,
+        device=torch.device(args.device),
+        skip_forward=args.skip_forward,
+    )
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            rows = compare(report, json.load(f), args.tolerance, args.min_delta_ms)
+        report["comparison"] = rows
+        for row in rows:
+            flag = "REGRESSION" if row["regression"] else "ok"
+            print(
+                f"{row['stage']:<22} {json.dumps(row['params']):<48} "
+                f"{row['baseline_ms']:9.2f} -> {row['current_ms']:9.2f} ms (x{row['ratio']:.2f}) {flag}",
+                file=sys.stderr,
+            )
+        if any(row["regression"] for row in rows):
+            status = 1
+
+    text = json.dumps(report, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    elif not args.save_baseline:
+        print(text)
+    return status
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,168 @@
+"""
+Load test the API against a local uvicorn, without a checkpoint.
+
+For every combination of `--env` values and `--workers`, a fresh uvicorn is started
+with MODEL_BACKEND=stub (unless overridden), then each `--concurrency` level sends
+`--requests` identical synthetic shelf photos over keep-alive connections. Reports
+throughput, p50/p95/p99 client latency and error rate per case.
+
+The stub sleeps STUB_LATENCY_MS per forward pass and returns synthetic heads, so
+decoding, preprocessing and post-processing are the real code paths
+(STUB_PER_IMAGE_MS has no effect: the service never batches requests). Results depend only on the arguments and
+the host, so runs before/after a scheduling change are directly comparable.
+
+Usage (from shelfscout_backend/):
+
+    python -m benchmarks.loadtest --concurrency 1,4,16 --requests 200
+    python -m benchmarks.loadtest --env STUB_LATENCY_MS=20,80 --env CASCADE_MODE=off,on \
+        --workers 1,2 --concurrency 1,8,32 --out load.json
+
+    # Real model instead of the stub
+    python -m benchmarks.loadtest --env MODEL_BACKEND=torch --env MODEL_PATH=checkpoints/shelfscout_latest.pth
+
+    # An already running server (--env/--workers are ignored)
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from benchmarks.hotpaths import _ints, synthetic_shelf_image
+from benchmarks.upload import PATHS, run_case
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ENV = {"MODEL_BACKEND": "stub"}
+
+
+def env_grid(specs: Sequence[str]) -> List[Dict[str, str]]:
+    """["A=1,2", "B=x"] -> [{"A": "1", "B": "x"}, {"A": "2", "B": "x"}]"""
+    axes = []
+    for spec in specs:
+        key, sep, values = spec.partition("=")
+        if not sep or not key:
+            raise ValueError(f"--env expects KEY=v1,v2,... (got '{spec}')")
+        axes.append([(key, v) for v in values.split(",")])
+    return [dict(combo) for combo in itertools.product(*axes)]
+
+
+def _wait_healthy(url: str, proc: subprocess.Popen, timeout_s: float) -> None:
+    deadline = time.time() + timeout_s
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with status {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"{url}/health", timeout=2) as r:
+                if r.status == 200:
+                    return
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} not healthy after {timeout_s:.0f}s")
+
+
+@contextmanager
+def local_server(env: Dict[str, str], workers: int, port: int, startup_timeout_s: float = 120.0) -> Iterator[str]:
+    """Run uvicorn with `env` layered over the current environment; yields its base URL."""
+    url = f"http://127.0.0.1:{port}"
+    cmd = [
+        sys.executable, "-m", "uvicorn", "app.api.main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(workers), "--log-level", "warning", "--no-access-log",
+    ]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env={**os.environ, **env})
+    try:
+        _wait_healthy(url, proc, startup_timeout_s)
+        yield url
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+def sweep(
+    url: str,
+    image: bytes,
+    endpoint: str,
+    concurrency: Sequence[int],
+    requests: int,
+    fields: str,
+    labels: Dict[str, Any],
+) -> List[Dict[str, Any]]:
+    rows = []
+    for c in concurrency:
+        row = run_case(url, endpoint, image, c, requests, fields)
+        total = row["requests"]
+        row = {**labels, **row, "error_rate": row["errors"] / total if total else 0.0}
+        rows.append(row)
+        print(
+            f"{json.dumps(labels):<60} c={c:<4} {row['throughput_rps']:8.1f} req/s "
+            f"p50={row.get('p50_ms', float('nan')):8.1f} p95={row.get('p95_ms', float('nan')):8.1f} "
+            f"p99={row.get('p99_ms', float('nan')):8.1f} ms errors={row['error_rate']:.1%}",
+            file=sys.stderr,
+        )
+    return rows
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--env", action="append", default=[], metavar="KEY=v1,v2",
+                    help="Server setting to sweep (repeatable; all combinations are run)")
+    ap.add_argument("--workers", type=_ints, default=[1], help="uvicorn worker counts to sweep")
+    ap.add_argument("--concurrency", type=_ints, default=[1, 4, 16])
+    ap.add_argument("--requests", type=int, default=200, help="Timed requests per case")
+    ap.add_argument("--endpoint", choices=PATHS, default="multipart", help="/predict or /predict/raw")
+    ap.add_argument("--fields", default="", help="?fields= for every request (default: all outputs)")
+    ap.add_argument("--image-width", type=int, default=1280, help="Synthetic 4:3 JPEG width")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--url", help="Load an already running server instead of starting uvicorn")
+    ap.add_argument("--out", help="Write results JSON here (default: stdout)")
+    args = ap.parse_args(argv)
+
+    image = synthetic_shelf_image(args.image_width, args.image_width * 3 // 4)
+    results: List[Dict[str, Any]] = []
+    if args.url:
+        results += sweep(args.url, image, args.endpoint, args.concurrency, args.requests, args.fields,
+                         {"url": args.url})
+    else:
+        for env in env_grid(args.env):
+            server_env = {**DEFAULT_ENV, **env}
+            for workers in args.workers:
+                with local_server(server_env, workers, args.port) as url:
+                    results += sweep(url, image, args.endpoint, args.concurrency, args.requests, args.fields,
+                                     {"env": server_env, "workers": workers})
+
+    report = {
+        "meta": {
+            "endpoint": args.endpoint,
+            "fields": args.fields,
+            "image_bytes": len(image),
+            "requests": args.requests,
+            "cpu_count": os.cpu_count(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 1 if any(r["errors"] for r in results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,177 @@
+"""
+Per-request upload overhead: multipart /predict vs. raw-body /predict/raw.
+
+Sends the same synthetic images to a running server over keep-alive connections
+(one per client thread) and reports throughput, client latency percentiles and the
+server-side `read`/`decode` stages from Server-Timing. By default requests use
+`fields=image_size`, which runs no model heads, so the numbers isolate transport,
+body parsing and image decoding; pass `--fields ""` to include full inference.
+
+Usage (from shelfscout_backend/, with the API running):
+
+    uvicorn app.api.main:app --port 8000 &
+    python -m benchmarks.upload --url http://127.0.0.1:8000 \
+        --image-sizes 512,1280,3000 --concurrency 1,8 --requests 200 --out upload.json
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import statistics
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.hotpaths import _ints, synthetic_shelf_image
+
+PATHS = ("multipart", "raw")
+
+
+def _server_timing(header: str) -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        for p in params.split(";"):
+            k, _, v = p.strip().partition("=")
+            if k == "dur":
+                out[name] = float(v)
+    return out
+
+
+def _multipart(image: bytes) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="shelf.jpg"\r\n'
+        "Content-Type: image/jpeg\r\n\r\n"
+    ).encode() + image + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+def _percentile(sorted_ms: List[float], q: float) -> float:
+    return sorted_ms[min(len(sorted_ms) - 1, int(round(q * (len(sorted_ms) - 1))))]
+
+
+def run_case(url: str, path: str, image: bytes, concurrency: int, requests: int, fields: str) -> Dict[str, Any]:
+    parts = urlsplit(url)
+    query = urlencode({"fields": fields}) if fields else ""
+    if path == "multipart":
+        body, content_type = _multipart(image)
+        target = "/predict"
+    else:
+        body, content_type = image, "image/jpeg"
+        target = "/predict/raw"
+    target += f"?{query}" if query else ""
+    headers = {"Content-Type": content_type, "Content-Length": str(len(body))}
+
+    local = threading.local()
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = {"read": [], "decode": [], "total": []}
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_: int) -> None:
+        nonlocal errors
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=120)
+        t0 = time.perf_counter()
+        try:
+            conn.request("POST", target, body=body, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            ok = resp.status == 200
+            timing = _server_timing(resp.getheader("Server-Timing", ""))
+        except (OSError, http.client.HTTPException):
+            local.conn = None
+            ok, timing = False, {}
+        ms = (time.perf_counter() - t0) * 1000.0
+        with lock:
+            if not ok:
+                errors += 1
+                return
+            latencies.append(ms)
+            for k in stages:
+                if k in timing:
+                    stages[k].append(timing[k])
+
+    # One untimed request per connection so connection setup isn't measured
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(concurrency)))
+        latencies.clear()
+        for v in stages.values():
+            v.clear()
+        errors = 0
+        t0 = time.perf_counter()
+        list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - t0
+
+    latencies.sort()
+    row: Dict[str, Any] = {
+        "path": path,
+        "upload_bytes": len(body),
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "throughput_rps": len(latencies) / wall if wall > 0 else 0.0,
+    }
+    if latencies:
+        row.update(
+            p50_ms=_percentile(latencies, 0.50),
+            p95_ms=_percentile(latencies, 0.95),
+            p99_ms=_percentile(latencies, 0.99),
+        )
+    for k, v in stages.items():
+        if v:
+            row[f"server_{k}_ms"] = statistics.median(v)
+    return row
+
+
+def run(url: str, image_sizes: Sequence[int], concurrency: Sequence[int], requests: int, fields: str) -> Dict[str, Any]:
+    results = []
+    for size in image_sizes:
+        image = synthetic_shelf_image(size, size * 3 // 4)
+        for c in concurrency:
+            for path in PATHS:
+                row = {"image_width": size, **run_case(url, path, image, c, requests, fields)}
+                results.append(row)
+                print(
+                    f"{path:<9} width={size:<5} c={c:<3} {row['throughput_rps']:8.1f} req/s "
+                    f"p50={row.get('p50_ms', float('nan')):8.2f} p99={row.get('p99_ms', float('nan')):8.2f} ms "
+                    f"read={row.get('server_read_ms', float('nan')):7.2f} decode={row.get('server_decode_ms', float('nan')):7.2f} ms "
+                    f"errors={row['errors']}",
+                    file=sys.stderr,
+                )
+    return {
+        "meta": {"url": url, "fields": fields, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://127.0.0.1:8000")
+    ap.add_argument("--image-sizes", type=_ints, default=[512, 1280, 3000], help="Image widths (4:3 JPEG)")
+    ap.add_argument("--concurrency", type=_ints, default=[1, 8])
+    ap.add_argument("--requests", type=int, default=200, help="Timed requests per case")
+    ap.add_argument("--fields", default="image_size", help='Passed as ?fields= ("" = full inference)')
+    ap.add_argument("--out", help="Write results JSON here (default: stdout)")
+    args = ap.parse_args(argv)
+
+    report = run(args.url, args.image_sizes, args.concurrency, args.requests, args.fields)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
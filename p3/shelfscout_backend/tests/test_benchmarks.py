@@ -0,0 +1,30 @@
+from benchmarks.hotpaths import compare, synthetic_head_outputs
+from app.ml.postprocess import decode_centers
+
+
+def _report(ms):
+    return {"results": [{"stage": "forward", "params": {"image_size": 512, "batch": 1}, "median_ms": ms}]}
+
+
+def test_compare_flags_only_real_slowdowns():
+    assert compare(_report(130.0), _report(100.0), tolerance=0.15, min_delta_ms=0.5)[0]["regression"]
+    assert not compare(_report(110.0), _report(100.0), tolerance=0.15, min_delta_ms=0.5)[0]["regression"]
+    # Large relative change but below the absolute noise floor
+    assert not compare(_report(0.3), _report(0.1), tolerance=0.15, min_delta_ms=0.5)[0]["regression"]
+
+
+def test_synthetic_heads_decode_to_requested_centers():
+    heads = synthetic_head_outputs(feat_size=64, n_centers=5, seed=3)
+    centers = decode_centers(heads["ctr_logits"], stride=4)[0]
+    assert 1 <= len(centers) <= 5
+
+
+def test_loadtest_env_grid_is_cartesian():
+    from benchmarks.loadtest import env_grid
+
+    grid = env_grid(["STUB_LATENCY_MS=20,80", "CASCADE_MODE=on"])
+    assert grid == [
+        {"STUB_LATENCY_MS": "20", "CASCADE_MODE": "on"},
+        {"STUB_LATENCY_MS": "80", "CASCADE_MODE": "on"},
+    ]
+    assert env_grid([]) == [{}]
@@ -7,3 +7,12 @@ def test_health():
     r = client.get("/health")
     assert r.status_code == 200
     assert r.json()["status"] == "ok"
+
+
+def test_input_spec():
+    r = client.get("/input-spec")
+    assert r.status_code == 200
+    spec = r.json()
+    assert spec["width"] == spec["height"] == spec["image_size"]
+    assert spec["feature_map_size"] == [spec["image_size"] // spec["stride"]] * 2
+    assert spec["preferred_format"] in spec["accepted_formats"]
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from app.core.history import HistoryStore, rle_decode, rle_encode
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = HistoryStore(str(tmp_path / "history.db"))
+    yield s
+    s.close()
+
+
+def _result(empty_ratio, instances=10, bbox=(0, 127, 0, 127)):
+    return {"empty_ratio": empty_ratio, "predicted_instances": instances, "shelf_bbox": list(bbox), "model_version": "v1"}
+
+
+def test_range_and_latest_per_shelf(store):
+    store.record("s1", "a", _result(0.1), camera_id="cam1", ts=100.0)
+    store.record("s1", "a", _result(0.5), camera_id="cam1", ts=200.0)
+    # Late-arriving older result must not replace the latest row
+    store.record("s1", "a", _result(0.9), camera_id="cam2", ts=150.0)
+    store.record("s1", "b", _result(0.2), ts=180.0)
+
+    rows = store.range("s1", "a", start=120.0)
+    assert [r["ts"] for r in rows] == [150.0, 200.0]
+    assert rows[-1]["shelf_bbox"] == [0, 127, 0, 127]
+    assert [r["ts"] for r in store.range("s1", "a", camera_id="cam1")] == [100.0, 200.0]
+    assert [r["shelf_id"] for r in store.range(start=160.0, end=190.0)] == ["b"]
+
+    alerts = store.above_threshold(0.3)
+    assert [(r["shelf_id"], r["empty_ratio"]) for r in alerts] == [("a", 0.5)]
+    assert store.stats()["shelves"] == 2
+
+    # A newer result without empty_ratio is kept in history but doesn't blank the latest row.
+    store.record("s1", "a", {"empty_ratio": None}, ts=300.0)
+    assert [(r["shelf_id"], r["empty_ratio"]) for r in store.above_threshold(0.3)] == [("a", 0.5)]
+
+
+def test_trend_buckets_and_rolling_average(store):
+    for ts, ratio in [(0, 0.1), (10, 0.3), (60, 0.5), (180, 0.9)]:
+        store.record("s1", "a", _result(ratio), ts=float(ts))
+    buckets = store.trend("s1", "a", start=0.0, end=239.0, bucket_s=60.0, window=2)
+    assert [b["start"] for b in buckets] == [0.0, 60.0, 180.0]
+    assert buckets[0]["empty_ratio_avg"] == pytest.approx(0.2)
+    # Bucket 1 averages its sample with bucket 0's two samples
+    assert buckets[1]["rolling_empty_ratio"] == pytest.approx(0.3)
+    # Bucket 2's window (buckets 2-3) has no earlier data
+    assert buckets[2]["rolling_empty_ratio"] == pytest.approx(0.9)
+
+
+def test_rle_roundtrip_and_stored_masks(store):
+    mask = np.zeros((4, 5), dtype=bool)
+    mask[0, 0] = mask[1, 2:] = mask[3, 4] = True
+    rle = rle_encode(mask)
+    assert rle["counts"][0] == 0 and sum(rle["counts"]) == 20
+    assert np.array_equal(rle_decode(rle), mask)
+
+    store.record("s1", "a", _result(0.1), ts=1.0, masks_rle={"product": rle})
+    row = store.range("s1", "a", include_masks=True)[0]
+    assert np.array_equal(rle_decode(row["masks_rle"]["product"]), mask)
+
+
+def test_predict_records_history_when_ids_given(store, monkeypatch):
+    import io
+
+    import torch
+    from fastapi.testclient import TestClient
+    from PIL import Image
+
+    from app.api import history as history_api
+    from app.api import main
+    from app.ml import inference
+    from app.ml.registry import ModelRegistry, ModelVersion
+    from app.ml.stub import StubPanopticModel
+
+    reg = ModelRegistry()
+    reg._register(ModelVersion("stub", "", StubPanopticModel(latency_ms=0.0), torch.device("cpu")),
+                  activate=True, candidate_pct=None)
+    monkeypatch.setattr(inference, "registry", reg)
+    monkeypatch.setattr(main, "history_store", store)
+    monkeypatch.setattr(history_api, "history_store", store)
+
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 64), (128, 128, 128)).save(buf, format="JPEG")
+    client = TestClient(main.app)
+    files = {"file": ("a.jpg", buf.getvalue(), "image/jpeg")}
+
+    r = client.post("/predict", files=files, params={"store_id": "s1", "shelf_id": "a", "captured_at": 1000})
+    assert r.status_code == 200
+    assert r.json()["history_id"] == 1
+    assert "history;dur=" in r.headers["server-timing"]
+    assert "history_id" not in client.post("/predict", files=files).json()
+    assert client.post("/predict", files=files, params={"store_id": "s1"}).status_code == 422
+
+    rows = client.get("/history/shelves/s1/a").json()
+    assert [row["ts"] for row in rows] == [1000.0]
+    assert rows[0]["empty_ratio"] == r.json()["empty_ratio"]
+    alerts = client.get("/history/alerts", params={"threshold": 0.0}).json()
+    assert alerts["count"] == 1
+
+    # Narrowed fields: history still gets the summary outputs, the response only what was asked for.
+    narrow = client.post("/predict", files=files,
+                         params={"store_id": "s1", "shelf_id": "a", "captured_at": 2000, "fields": "image_size"})
+    assert set(narrow.json()) == {"image_size", "model_version", "history_id"}
+    rows = client.get("/history/shelves/s1/a").json()
+    assert rows[-1]["empty_ratio"] == r.json()["empty_ratio"]
+    assert rows[-1]["instances"] == r.json()["predicted_instances"]
+    assert client.get("/history/alerts", params={"threshold": 0.0}).json()["count"] == 1
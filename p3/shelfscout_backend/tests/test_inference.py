@@ -0,0 +1,164 @@
+import io
+
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+
+from app.ml import inference
+from app.ml.registry import ModelRegistry, ModelVersion
+from benchmarks.hotpaths import synthetic_head_outputs
+
+
+class _FakeModel(torch.nn.Module):
+    """Returns synthetic head outputs and records which heads were requested."""
+
+    def __init__(self, fully_stocked=False):
+        super().__init__()
+        self.calls = []
+        self.fully_stocked = fully_stocked
+
+    def forward(self, x, heads=("sem", "ctr", "off")):
+        self.calls.append(tuple(heads))
+        h = synthetic_head_outputs(x.shape[-1] // 4, n_centers=8)
+        if self.fully_stocked:
+            h["sem_logits"][:, 0], h["sem_logits"][:, 1] = -8.0, 8.0
+        return (
+            h["sem_logits"] if "sem" in heads else None,
+            h["ctr_logits"] if "ctr" in heads else None,
+            h["offsets"] if "off" in heads else None,
+        )
+
+
+def _install(monkeypatch, model):
+    reg = ModelRegistry()
+    reg._register(ModelVersion("fake", "fake.pth", model, torch.device("cpu")), activate=True, candidate_pct=None)
+    monkeypatch.setattr(inference, "registry", reg)
+    return model
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    return _install(monkeypatch, _FakeModel())
+
+
+def _jpeg(size=96):
+    buf = io.BytesIO()
+    Image.fromarray(np.full((size, size, 3), 128, dtype=np.uint8)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def test_full_prediction_returns_all_fields(fake_model):
+    out = inference.predict_from_bytes(_jpeg())
+    assert set(inference.ALL_FIELDS) <= set(out)
+    assert out["model_version"] == "fake"
+    assert fake_model.calls == [("sem", "ctr", "off")]
+
+
+def test_summary_fields_skip_center_and_offset_heads(fake_model):
+    timer = inference.StageTimer()
+    out = inference.predict_from_bytes(_jpeg(), fields=["empty_ratio", "shelf_bbox"], timer=timer)
+    assert set(out) == {"empty_ratio", "shelf_bbox", "model_version"}
+    assert fake_model.calls == [("sem",)]
+    assert "centers" not in timer.stages_ms
+    assert "reconstruct" not in timer.stages_ms
+
+
+def test_unknown_field_rejected(fake_model):
+    with pytest.raises(ValueError):
+        inference.predict_from_bytes(_jpeg(), fields=["nope"])
+
+
+def test_cascade_short_circuits_confidently_stocked_shelf(monkeypatch):
+    model = _install(monkeypatch, _FakeModel(fully_stocked=True))
+    out = inference.predict_from_bytes(_jpeg(), cascade=True)
+    assert out["cascade"]["decision"] == "short_circuit"
+    assert model.calls == [("sem",)]
+    assert out["empty_ratio"] == 0.0
+    assert out["predicted_instances"] is None
+    # Screen results are reported in full-resolution feature space.
+    assert out["feature_map_size"] == [128, 128]
+    assert out["shelf_bbox"] == [0, 127, 0, 127]
+
+
+def test_cascade_skipped_when_instance_fields_requested(monkeypatch):
+    model = _install(monkeypatch, _FakeModel(fully_stocked=True))
+    out = inference.predict_from_bytes(_jpeg(), cascade=True, fields=["empty_ratio", "predicted_instances"])
+    assert "cascade" not in out
+    assert model.calls == [("sem", "ctr", "off")]
+    assert out["predicted_instances"] is not None
+
+
+def test_cascade_skipped_when_no_heads_needed(fake_model):
+    timer = inference.StageTimer()
+    out = inference.predict_from_bytes(_jpeg(), cascade=True, fields=["image_size"], timer=timer)
+    assert "cascade" not in out
+    assert fake_model.calls == []
+    assert not any(name.startswith("screen_") for name in timer.stages_ms)
+
+
+def test_cascade_runs_full_pipeline_when_uncertain(fake_model):
+    out = inference.predict_from_bytes(_jpeg(), cascade=True)
+    assert out["cascade"]["decision"] == "full"
+    assert fake_model.calls == [("sem",), ("sem", "ctr", "off")]
+    assert out["predicted_instances"] is not None
+
+
+def _noise_image(fmt, size=(80, 60)):
+    arr = np.random.default_rng(0).integers(0, 255, size=(size[1], size[0], 3), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(arr).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("fmt", ["JPEG", "PNG", "WEBP"])
+def test_streaming_decoder_matches_one_shot_decode(fmt):
+    data = _noise_image(fmt)
+    decoder = inference.StreamingImageDecoder(max_bytes=len(data))
+    for i in range(0, len(data), 7):
+        decoder.feed(data[i:i + 7])
+    assert decoder.format == f"image/{fmt.lower()}"
+    assert np.array_equal(np.asarray(decoder.close()), np.asarray(inference.decode_image_bytes(data)))
+
+
+def test_streaming_decoder_rejects_oversized_and_unknown_uploads():
+    data = _noise_image("PNG")
+    decoder = inference.StreamingImageDecoder(max_bytes=len(data) - 1)
+    with pytest.raises(inference.UploadTooLarge):
+        for i in range(0, len(data), 64):
+            decoder.feed(data[i:i + 64])
+    with pytest.raises(inference.UnsupportedImage):
+        inference.StreamingImageDecoder(max_bytes=1024).feed(b"GIF89a" + b"\0" * 32)
+
+
+def test_raw_endpoint_matches_multipart(fake_model):
+    from fastapi.testclient import TestClient
+    from app.api.main import app
+
+    client = TestClient(app)
+    data = _jpeg()
+    multipart = client.post("/predict", files={"file": ("a.jpg", data, "image/jpeg")})
+    raw = client.post("/predict/raw", content=data, headers={"content-type": "image/jpeg"})
+    assert raw.status_code == multipart.status_code == 200
+    assert raw.json() == multipart.json()
+    assert "read;dur=" in raw.headers["server-timing"]
+
+    assert client.post("/predict/raw", content=b"not an image", headers={"content-type": "application/octet-stream"}).status_code == 415
+    assert client.post("/predict/raw", content=data, headers={"content-type": "text/plain"}).status_code == 415
+
+
+def test_streaming_decoder_reads_header_before_body_completes():
+    data = _noise_image("PNG", size=(200, 100))
+    decoder = inference.StreamingImageDecoder(max_bytes=len(data))
+    decoder.feed(data[:256])
+    assert decoder.image_size == (200, 100)
+
+
+def test_stub_model_runs_real_postprocessing(monkeypatch):
+    from app.ml.stub import StubPanopticModel
+
+    _install(monkeypatch, StubPanopticModel(latency_ms=0.0))
+    out = inference.predict_from_bytes(_jpeg())
+    assert out["feature_map_size"] == [128, 128]
+    assert out["decoded_centers"] > 0
+    assert out["predicted_instances"] > 0
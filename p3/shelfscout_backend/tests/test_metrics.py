@@ -0,0 +1,36 @@
+from fastapi.testclient import TestClient
+
+from app.api.main import app
+from app.core.timing import StageTimer
+
+client = TestClient(app)
+
+
+def test_metrics_endpoint_exposes_prometheus_text():
+    client.get("/health")
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain")
+    assert "shelfscout_inflight_requests" in r.text
+    assert 'route="/health"' in r.text
+
+
+def test_stage_timer_server_timing_header():
+    timer = StageTimer()
+    with timer.stage("decode"):
+        pass
+    timer.add("forward", 12.34)
+    header = timer.server_timing()
+    assert header.startswith("decode;dur=")
+    assert "forward;dur=12.3" in header
+    assert header.split(", ")[-1].startswith("total;dur=")
+
+
+def test_stage_histogram_is_labelled_with_model_version():
+    from app.core.metrics import STAGE_SECONDS
+
+    timer = StageTimer()
+    timer.model_version = "cand-v2"
+    timer.add("forward", 5.0)
+    assert STAGE_SECONDS.labels(stage="forward", model_version="cand-v2")._sum.get() >= 0.005
+    assert 'model_version="cand-v2"' in client.get("/metrics").text
@@ -0,0 +1,28 @@
+import pytest
+import torch
+
+from app.ml.model import ShelfScoutPanopticCNN, build_backbone
+from app.ml.registry import load_checkpoint
+
+
+@pytest.mark.parametrize("backbone", ["resnet18", "mobilenet_v3_small"])
+def test_backbones_produce_stride4_heads(backbone):
+    model = ShelfScoutPanopticCNN(backbone=backbone, fpn_channels=32).eval()
+    with torch.no_grad():
+        sem, ctr, off = model(torch.zeros(1, 3, 128, 128))
+    assert sem.shape == (1, 2, 32, 32)
+    assert ctr.shape == (1, 1, 32, 32)
+    assert off.shape == (1, 2, 32, 32)
+
+
+def test_unknown_backbone_rejected():
+    with pytest.raises(ValueError):
+        build_backbone("vgg16")
+
+
+def test_checkpoint_arch_roundtrip(tmp_path):
+    model = ShelfScoutPanopticCNN(backbone="mobilenet_v3_small", fpn_channels=32)
+    path = tmp_path / "student.pth"
+    torch.save({"model_state": model.state_dict(), "arch": model.arch}, path)
+    loaded = load_checkpoint(str(path), torch.device("cpu"))
+    assert loaded.arch == {"backbone": "mobilenet_v3_small", "fpn_channels": 32}
@@ -0,0 +1,44 @@
+import pytest
+import torch
+
+from app.core.config import Settings
+from app.ml.postprocess import PostprocessEngine, PostprocessParams, get_engine
+
+
+def test_engine_is_cached_per_geometry():
+    assert get_engine(16, 16, 4, "cpu") is get_engine(16, 16, 4, "cpu")
+    assert get_engine(16, 16, 4, "cpu") is not get_engine(16, 16, 8, "cpu")
+
+
+def test_params_overrides_ignore_none():
+    p = PostprocessParams().with_overrides(top_k=5, sem_thresh=None)
+    assert p.top_k == 5
+    assert p.sem_thresh == PostprocessParams().sem_thresh
+
+
+def test_reconstruct_uses_engine_stride():
+    Hf = Wf = 16
+    stride = 8
+    engine = get_engine(Hf, Wf, stride, "cpu")
+    ctr_logits = torch.full((1, 1, Hf, Wf), -10.0)
+    ctr_logits[0, 0, 5, 9] = 10.0
+    centers = engine.decode_centers(ctr_logits)[0]
+    assert centers.shape == (1, 3)
+    assert centers[0, :2].tolist() == [(9 + 0.5) * stride, (5 + 0.5) * stride]
+
+    sem_prob = torch.zeros(Hf, Wf)
+    sem_prob[3:8, 7:12] = 1.0
+    instance_map = engine.reconstruct_instances(
+        sem_prob, centers, torch.zeros(2, Hf, Wf), PostprocessParams(max_radius=2, min_pixels=1)
+    )
+    assert PostprocessEngine.count_instances(instance_map) == 1
+    # Only foreground pixels within the radius of center (y=5, x=9) are assigned.
+    assert instance_map[5, 9] == 1
+    assert instance_map[3, 7] == 0
+    assert instance_map[0, 0] == 0
+
+
+@pytest.mark.parametrize("kernel", [0, 4])
+def test_settings_reject_invalid_nms_kernel(kernel):
+    with pytest.raises(ValueError, match="NMS_KERNEL"):
+        Settings(nms_kernel=kernel)
@@ -0,0 +1,114 @@
+import dataclasses
+import json
+import os
+
+import torch
+
+from app.ml.profiling import LiveProfiler
+
+
+def test_capture_stops_after_n_requests_and_writes_summary(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    prof = LiveProfiler()
+    info = prof.start(requests=1, python_sampling=False)
+
+    with prof.capture():
+        torch.relu(torch.randn(64, 64)).sum()
+    # Past the limit: a plain no-op.
+    with prof.capture():
+        pass
+
+    status = prof.status()
+    assert status["running"] is None
+    assert status["last"]["requests"] == 1
+    out_dir = info["out_dir"]
+    assert os.path.exists(os.path.join(out_dir, "request_001.trace.json"))
+    with open(os.path.join(out_dir, "summary.json"), encoding="utf-8") as f:
+        summary = json.load(f)
+    assert any(r["name"] == "aten::relu" for r in summary["top_by_total_cpu"])
+
+
+def test_signal_flag_arms_capture_on_next_request_and_hooks_lazily(tmp_path, monkeypatch):
+    from app.ml import profiling
+
+    model = torch.nn.Sequential(torch.nn.Linear(8, 8))
+
+    class _Entry:
+        def __init__(self, m):
+            self.model = m
+
+    # Nothing loaded when the signal arrives; the model appears before the next request.
+    monkeypatch.setattr(profiling.registry, "ensure_default", lambda: None)
+    monkeypatch.setattr(profiling.registry, "loaded", lambda: [_Entry(model)])
+    monkeypatch.setattr(profiling, "settings", dataclasses.replace(profiling.settings, profile_default_requests=1))
+    monkeypatch.chdir(tmp_path)
+
+    prof = LiveProfiler()
+    prof.start_on_next_request()
+    assert prof.status()["running"] is None
+
+    with prof.capture():
+        model(torch.randn(2, 8))
+
+    last = prof.status()["last"]
+    assert last["requests"] == 1
+    with open(os.path.join(last["out_dir"], "summary.json"), encoding="utf-8") as f:
+        summary = json.load(f)
+    assert any(r["name"] == "0 (Linear)" for r in summary["top_by_total_cpu"])
+    # Hooks are gone once the capture ends.
+    assert not model[0]._forward_pre_hooks
+
+
+def test_capture_ids_are_unique_and_slots_are_bounded(tmp_path, monkeypatch):
+    from app.ml import profiling
+
+    monkeypatch.setattr(profiling.registry, "ensure_default", lambda: None)
+    monkeypatch.setattr(profiling.registry, "loaded", lambda: [])
+    monkeypatch.chdir(tmp_path)
+    prof = LiveProfiler()
+    first = prof.start(requests=1, python_sampling=False)
+    prof.stop()
+    second = prof.start(requests=1, python_sampling=False)
+    assert first["out_dir"] != second["out_dir"]
+
+    # Two overlapping requests against a 1-request capture: only the first is profiled.
+    outer = prof.capture()
+    outer.__enter__()
+    with prof.capture():
+        pass
+    outer.__exit__(None, None, None)
+    assert prof.status()["last"]["requests"] == 1
+
+
+def test_overlapping_requests_are_profiled_one_at_a_time(tmp_path, monkeypatch):
+    import threading
+
+    from app.ml import profiling
+
+    monkeypatch.setattr(profiling.registry, "ensure_default", lambda: None)
+    monkeypatch.setattr(profiling.registry, "loaded", lambda: [])
+    monkeypatch.chdir(tmp_path)
+    prof = LiveProfiler()
+    prof.start(requests=4, python_sampling=False)
+
+    inside = threading.Barrier(2, timeout=10)
+
+    def request():
+        with prof.capture():
+            # Both threads are inside capture() at the same time.
+            inside.wait()
+            torch.relu(torch.randn(16, 16))
+
+    threads = [threading.Thread(target=request) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(timeout=30)
+
+    status = prof.status()["running"]
+    assert status["requests"] == 1
+    assert len(status["files"]) == 1
+    # The next request after the overlap is profiled again.
+    with prof.capture():
+        pass
+    assert prof.status()["running"]["requests"] == 2
@@ -0,0 +1,57 @@
+import pytest
+import torch
+
+from app.ml.registry import ModelRegistry, ModelVersion, UnknownModelVersion
+
+
+def _entry(version):
+    return ModelVersion(version=version, path=f"{version}.pth", model=torch.nn.Identity(), device=torch.device("cpu"))
+
+
+def _registry(*versions):
+    reg = ModelRegistry()
+    for v in versions:
+        reg._register(_entry(v), activate=(v == versions[0]), candidate_pct=None)
+    return reg
+
+
+def test_first_version_becomes_active():
+    reg = _registry("v1")
+    with reg.lease() as served:
+        assert served.version == "v1"
+
+
+def test_switch_keeps_old_version_until_drained():
+    reg = _registry("v1", "v2")
+    with reg.lease() as old:
+        reg.activate("v2")
+        # The in-flight request keeps its model...
+        assert old.version == "v1"
+        assert "v1" in [v["version"] for v in reg.status()["versions"]]
+        with reg.lease() as new:
+            assert new.version == "v2"
+    # ...and the retired version is dropped once it has drained.
+    assert [v["version"] for v in reg.status()["versions"]] == ["v2"]
+
+
+def test_candidate_receives_traffic_share():
+    reg = _registry("v1", "v2")
+    reg.set_candidate("v2", 100.0)
+    with reg.lease() as served:
+        assert served.version == "v2"
+    reg.set_candidate("v2", 0.0)
+    with reg.lease() as served:
+        assert served.version == "v1"
+
+
+def test_pinned_unknown_version_raises():
+    reg = _registry("v1")
+    with pytest.raises(UnknownModelVersion):
+        with reg.lease("nope"):
+            pass
+
+
+def test_cannot_unload_active():
+    reg = _registry("v1")
+    with pytest.raises(ValueError):
+        reg.unload("v1")
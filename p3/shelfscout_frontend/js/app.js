@@ -2,7 +2,9 @@
  * ShelfScout Offline Professional Frontend (No npm / No CDN)
  * Backend:
  *   GET  /health
+ *   GET  /input-spec  → model input geometry; images are downscaled/re-encoded to it before upload
  *   POST /predict?include_masks=true|false  (multipart field "file")
+ *        → Server-Timing header with the per-stage server-side breakdown
  */
 (function(){
   const LS = {
@@ -67,6 +69,7 @@
   let selectedFile = null;
   let lastPayload = null;
   let activeMask = "product";
+  let inputSpec = null;  // { base, spec } — cached GET /input-spec for the current base URL
 
   function save(k,v){ localStorage.setItem(k, String(v)); }
   function load(k, d=""){ const v = localStorage.getItem(k); return v === null ? d : v; }
@@ -141,7 +144,7 @@
     return "";
   }
 
-  async function fetchJson(url, opts){
+  async function fetchJson(url, opts, withHeaders=false){
     const controller = new AbortController();
     const t = setTimeout(()=>controller.abort(), 30000);
     try{
@@ -151,21 +154,93 @@
         const detail = data?.detail ? `: ${data.detail}` : "";
         throw new Error(`HTTP ${res.status}${detail}`);
       }
-      return data;
+      return withHeaders ? { data, headers: res.headers } : data;
     } finally {
       clearTimeout(t);
     }
   }
 
+  // "decode;dur=18.7, forward;dur=812.4, total;dur=870.1" → [["decode",18.7], ...]
+  function parseServerTiming(header){
+    const out = [];
+    (header || "").split(",").forEach(part => {
+      const [name, ...params] = part.trim().split(";");
+      if(!name) return;
+      const dur = params.map(p => p.trim().split("=")).find(([k]) => k === "dur");
+      const ms = dur ? Number(dur[1]) : NaN;
+      if(Number.isFinite(ms)) out.push([name, ms]);
+    });
+    return out;
+  }
+
   async function apiHealth(){
     return fetchJson(`${baseUrl()}/health`, { method:"GET" });
   }
 
+  async function apiInputSpec(){
+    const base = baseUrl();
+    if(inputSpec?.base === base) return inputSpec.spec;
+    let spec = null;
+    try{
+      spec = await fetchJson(`${base}/input-spec`, { method:"GET" });
+    } catch(e){
+      // Older backend without /input-spec: upload the original file
+    }
+    inputSpec = { base, spec };
+    return spec;
+  }
+
+  function canvasToBlob(canvas, type, quality){
+    return new Promise(resolve => canvas.toBlob(resolve, type, quality));
+  }
+
+  // Stretch to the model input size (as the server does) and re-encode as WebP/JPEG.
+  // Returns null when the browser can't do it or it wouldn't make the upload smaller.
+  async function downscaleForUpload(file, spec){
+    let bitmap;
+    try{
+      // The server ignores EXIF orientation; match it so results don't change.
+      bitmap = await createImageBitmap(file, { imageOrientation: "none" });
+    } catch(e){
+      return null;
+    }
+    const canvas = document.createElement("canvas");
+    canvas.width = spec.width;
+    canvas.height = spec.height;
+    const ctx = canvas.getContext("2d");
+    ctx.imageSmoothingEnabled = true;
+    ctx.imageSmoothingQuality = "high";
+    ctx.drawImage(bitmap, 0, 0, spec.width, spec.height);
+    bitmap.close?.();
+
+    const quality = (spec.quality ?? 90) / 100;
+    const stem = file.name.replace(/\.[^.]+$/, "") || "image";
+    for(const type of (spec.accepted_formats || ["image/jpeg"]).filter(t => t !== "image/png")){
+      const blob = await canvasToBlob(canvas, type, quality);
+      // Browsers without an encoder for `type` silently return PNG instead
+      if(!blob || blob.type !== type) continue;
+      if(blob.size >= file.size) return null;
+      return new File([blob], `${stem}.${type.split("/")[1]}`, { type });
+    }
+    return null;
+  }
+
   async function apiPredict(file, includeMasks){
+    const spec = await apiInputSpec();
+    const upload = (spec && await downscaleForUpload(file, spec)) || file;
     const fd = new FormData();
-    fd.append("file", file);
+    fd.append("file", upload);
     const url = `${baseUrl()}/predict?include_masks=${includeMasks ? "true" : "false"}`;
-    return fetchJson(url, { method:"POST", body: fd });
+    const { data, headers } = await fetchJson(url, { method:"POST", body: fd }, true);
+    return {
+      payload: data,
+      serverTiming: parseServerTiming(headers.get("Server-Timing")),
+      upload: { bytes: upload.size, originalBytes: file.size },
+    };
+  }
+
+  function fmtBytes(n){
+    return n >= 1024 * 1024 ? `${(n / (1024 * 1024)).toFixed(1)} MB` : `${Math.round(n / 1024)} KB`;
   }
 
   function fmtPct(x){
@@ -180,7 +255,7 @@
     return d;
   }
 
-  function renderCards(payload){
+  function renderCards(payload, serverTiming=[], upload=null){
     cards.innerHTML = "";
     cards.appendChild(miniCard("Empty ratio", fmtPct(payload.empty_ratio), "Estimated empty shelf area"));
     cards.appendChild(miniCard("Decoded centers", payload.decoded_centers ?? "—", "Center points after decoding"));
@@ -191,6 +266,15 @@
     const fm = Array.isArray(payload.feature_map_size) ? payload.feature_map_size.join("×") : (payload.feature_map_size ?? "—");
     cards.appendChild(miniCard("Feature map", fm, "Internal model resolution"));
     cards.appendChild(miniCard("Shelf bbox", payload.shelf_bbox ? "Available" : "—", "Bounding box available"));
+    const total = serverTiming.find(([n]) => n === "total");
+    if(total){
+      const breakdown = serverTiming.filter(([n]) => n !== "total").map(([n, ms]) => `${n} ${Math.round(ms)}`).join(" • ");
+      cards.appendChild(miniCard("Server time", `${Math.round(total[1])} ms`, breakdown || "Server-side processing"));
+    }
+    if(upload){
+      const from = upload.bytes !== upload.originalBytes ? `Downscaled from ${fmtBytes(upload.originalBytes)}` : "Original file";
+      cards.appendChild(miniCard("Upload", fmtBytes(upload.bytes), from));
+    }
   }
 
   function renderLabel(payload){
@@ -346,14 +430,14 @@ function reveal(el){
     const t0 = performance.now();
     try{
       setStatus("Processing", include ? "Running model + generating overlays…" : "Running model inference…", 60, true);
-      const payload = await apiPredict(selectedFile, include);
+      const { payload, serverTiming, upload } = await apiPredict(selectedFile, include);
       const ms = Math.round(performance.now() - t0);
 
       lastPayload = payload;
 
       setBadge(timeBadge, "badge-muted", `${ms} ms`);
       renderLabel(payload);
-      renderCards(payload);
+      renderCards(payload, serverTiming, upload);
       reveal(cards);
 
       const centersB64 = payload?.masks?.decoded_centers_overlay_png_b64;
@@ -1,11 +1,15 @@
 import base64
+import io
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 import streamlit as st
+from PIL import Image, features
+from requests.adapters import HTTPAdapter
 
 # =========================
 # Theme (your palette)
@@ -87,10 +91,46 @@ def inject_css() -> None:
     )
 
 
+# Upper bound for concurrent /predict calls in batch mode (also the connection pool size)
+MAX_PARALLEL = 8
+
+
+@st.cache_resource
+def get_session() -> requests.Session:
+    """One keep-alive session shared by all reruns and worker threads (connection reuse)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=MAX_PARALLEL)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 @dataclass
 class PredictResult:
     payload: Dict[str, Any]
     elapsed_ms: int
+    # Server-side stage breakdown from the Server-Timing header (ms, in pipeline order)
+    server_timing: Optional[List[Tuple[str, float]]] = None
+    # Bytes actually sent vs. the original file (differ when downscaled before upload)
+    upload_bytes: Optional[int] = None
+    original_bytes: Optional[int] = None
+
+
+def parse_server_timing(header: str) -> List[Tuple[str, float]]:
+    """Parse `forward;dur=812.4, total;dur=870.1` into [("forward", 812.4), ("total", 870.1)]."""
+    stages: List[Tuple[str, float]] = []
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if not name:
+            continue
+        for p in params.split(";"):
+            k, _, v = p.strip().partition("=")
+            if k == "dur":
+                try:
+                    stages.append((name, float(v)))
+                except ValueError:
+                    pass
+    return stages
 
 
 def b64_to_data_url_png(b64: str) -> str:
@@ -100,7 +140,7 @@ def b64_to_data_url_png(b64: str) -> str:
 def call_health(base_url: str, timeout_s: int = 10) -> Tuple[bool, str]:
     url = base_url.rstrip("/") + "/health"
     try:
-        r = requests.get(url, timeout=timeout_s)
+        r = get_session().get(url, timeout=timeout_s)
         if r.status_code != 200:
             return False, f"Health failed (HTTP {r.status_code})"
         return True, "Server connected"
@@ -108,13 +148,70 @@ def call_health(base_url: str, timeout_s: int = 10) -> Tuple[bool, str]:
         return False, f"Server not reachable ({e.__class__.__name__})"
 
 
-def call_predict(base_url: str, file_bytes: bytes, filename: str, mime_type: str, include_masks: bool, timeout_s: int = 60) -> PredictResult:
+@st.cache_data(ttl=300, show_spinner=False)
+def call_input_spec(base_url: str, timeout_s: int = 10) -> Optional[Dict[str, Any]]:
+    """Model input geometry advertised by the backend; None if unavailable (older backend)."""
+    url = base_url.rstrip("/") + "/input-spec"
+    try:
+        r = get_session().get(url, timeout=timeout_s)
+        if r.status_code != 200:
+            return None
+        return r.json()
+    except (requests.RequestException, ValueError):
+        return None
+
+
+def downscale_for_upload(file_bytes: bytes, spec: Dict[str, Any]) -> Tuple[bytes, str]:
+    """
+    Resize to the server's input size the same way the server does (stretch, bilinear)
+    and re-encode, so only the pixels the model will see are uploaded.
+    Returns (bytes, mime_type); the original bytes are kept if re-encoding doesn't help.
+    """
+    size = (int(spec["width"]), int(spec["height"]))
+    quality = int(spec.get("quality", 90))
+    accepted = spec.get("accepted_formats") or ["image/jpeg"]
+    preferred = spec.get("preferred_format", "image/jpeg")
+    if preferred == "image/webp" and not features.check("webp"):
+        preferred = "image/jpeg"
+    if preferred not in accepted:
+        preferred = "image/jpeg"
+
+    img = Image.open(io.BytesIO(file_bytes)).convert("RGB")
+    img = img.resize(size, resample=Image.BILINEAR)
+    buf = io.BytesIO()
+    img.save(buf, format=preferred.split("/")[1].upper(), quality=quality)
+    data = buf.getvalue()
+    if len(data) >= len(file_bytes):
+        return file_bytes, ""
+    return data, preferred
+
+
+def prepare_upload(file_bytes: bytes, filename: str, mime_type: str, spec: Optional[Dict[str, Any]]) -> Tuple[bytes, str, str]:
+    """Downscale per `spec` when given (and worthwhile). Returns (bytes, filename, mime_type)."""
+    if spec:
+        small, small_mime = downscale_for_upload(file_bytes, spec)
+        if small_mime:
+            stem = (filename or "image").rsplit(".", 1)[0]
+            return small, f"{stem}.{small_mime.split('/')[1]}", small_mime
+    return file_bytes, filename, mime_type
+
+
+def call_predict(
+    base_url: str,
+    file_bytes: bytes,
+    filename: str,
+    mime_type: str,
+    include_masks: bool,
+    timeout_s: int = 60,
+    session: Optional[requests.Session] = None,
+) -> PredictResult:
+    """Pass `session` from worker threads (get_session() is a st.cache_resource call)."""
     url = base_url.rstrip("/") + "/predict"
     t0 = time.perf_counter()
     mime_type = (mime_type or "image/jpeg").strip() or "image/jpeg"
     files = {"file": (filename or "image.jpg", file_bytes, mime_type)}
     params = {"include_masks": "true" if include_masks else "false"}
-    r = requests.post(url, files=files, params=params, timeout=timeout_s)
+    r = (session or get_session()).post(url, files=files, params=params, timeout=timeout_s)
     elapsed_ms = int((time.perf_counter() - t0) * 1000)
 
     try:
@@ -132,7 +229,18 @@ def call_predict(base_url: str, file_bytes: bytes, filename: str, mime_type: str
     if not isinstance(data, dict):
         raise RuntimeError("Predict returned non-JSON object")
 
-    return PredictResult(payload=data, elapsed_ms=elapsed_ms)
+    return PredictResult(
+        payload=data,
+        elapsed_ms=elapsed_ms,
+        server_timing=parse_server_timing(r.headers.get("Server-Timing", "")) or None,
+        upload_bytes=len(file_bytes),
+    )
+
+
+def fmt_bytes(n: int) -> str:
+    if n >= 1024 * 1024:
+        return f"{n / (1024 * 1024):.1f} MB"
+    return f"{n / 1024:.0f} KB"
 
 
 def classification_badge(empty_ratio: float, threshold_pct: float) -> Tuple[str, str]:
@@ -144,6 +252,118 @@ def classification_badge(empty_ratio: float, threshold_pct: float) -> Tuple[str,
     return "Well stocked", "ok"
 
 
+def analyze_file(
+    session: requests.Session,
+    base_url: str,
+    name: str,
+    file_bytes: bytes,
+    mime_type: str,
+    spec: Optional[Dict[str, Any]],
+) -> PredictResult:
+    """
+    Batch worker: runs in a pool thread, so it must not touch st.* APIs (including
+    cached functions like get_session(); the session is fetched on the script thread).
+    """
+    upload, filename, mime_type = prepare_upload(file_bytes, name, mime_type, spec)
+    result = call_predict(base_url, upload, filename, mime_type, include_masks=False, session=session)
+    result.original_bytes = len(file_bytes)
+    return result
+
+
+def batch_row(name: str, result: Optional[PredictResult], error: str, threshold_pct: float) -> Dict[str, Any]:
+    row: Dict[str, Any] = {"image": name, "status": "Error", "empty_ratio": None, "instances": None,
+                           "centers": None, "server_ms": None, "round_trip_ms": None, "error": error}
+    if result is not None:
+        payload = result.payload
+        empty_ratio = float(payload.get("empty_ratio") or 0.0)
+        timing = dict(result.server_timing or [])
+        row.update(
+            status=classification_badge(empty_ratio, threshold_pct)[0],
+            empty_ratio=round(empty_ratio * 100.0, 1),
+            instances=payload.get("predicted_instances"),
+            centers=payload.get("decoded_centers"),
+            server_ms=round(timing["total"]) if "total" in timing else None,
+            round_trip_ms=result.elapsed_ms,
+        )
+    return row
+
+
+def render_batch_table(placeholder, rows: List[Dict[str, Any]]) -> None:
+    placeholder.dataframe(
+        rows,
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "empty_ratio": st.column_config.ProgressColumn("Empty %", min_value=0, max_value=100, format="%.1f%%"),
+            "instances": st.column_config.NumberColumn("Instances"),
+            "centers": st.column_config.NumberColumn("Centers"),
+            "server_ms": st.column_config.NumberColumn("Server ms"),
+            "round_trip_ms": st.column_config.NumberColumn("Round trip ms"),
+        },
+    )
+
+
+def render_batch(base_url: str, threshold_pct: float) -> None:
+    st.markdown("## Batch audit")
+    st.caption("Upload several shelf images; they are analyzed concurrently and the table fills in as results arrive. "
+               "Click a column header to sort.")
+
+    uploads = st.file_uploader("Upload images", type=["jpg", "jpeg", "png", "webp"], accept_multiple_files=True)
+    too_big = [u.name for u in uploads or [] if u.size > 12 * 1024 * 1024]
+    if too_big:
+        st.warning(f"Skipping {len(too_big)} image(s) larger than 12MB: {', '.join(too_big)}")
+    todo = [u for u in uploads or [] if u.size <= 12 * 1024 * 1024]
+
+    c1, c2 = st.columns([0.7, 0.3])
+    with c1:
+        run = st.button(f"Analyze {len(todo)} image(s)", type="primary", use_container_width=True, disabled=not todo)
+    with c2:
+        if st.button("Clear table", use_container_width=True):
+            st.session_state.pop("batch_rows", None)
+
+    progress = st.empty()
+    table = st.empty()
+
+    if run:
+        spec = call_input_spec(base_url) if st.session_state.get("downscale", True) else None
+        parallel = int(st.session_state.get("parallel", 4))
+        session = get_session()
+        rows: List[Dict[str, Any]] = []
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            futures = {
+                pool.submit(analyze_file, session, base_url, u.name, u.getvalue(), getattr(u, "type", None) or "", spec): u.name
+                for u in todo
+            }
+            for done, fut in enumerate(as_completed(futures), start=1):
+                try:
+                    rows.append(batch_row(futures[fut], fut.result(), "", threshold_pct))
+                except Exception as e:
+                    rows.append(batch_row(futures[fut], None, str(e), threshold_pct))
+                progress.progress(done / len(futures), text=f"{done}/{len(futures)} analyzed")
+                render_batch_table(table, rows)
+        elapsed = time.perf_counter() - t0
+        progress.success(f"{len(rows)} image(s) in {elapsed:.1f} s ({parallel} in parallel)")
+        st.session_state["batch_rows"] = rows
+        return
+
+    rows = st.session_state.get("batch_rows")
+    if not rows:
+        table.info("Results will appear here.")
+        return
+    render_batch_table(table, rows)
+
+    flagged = sum(1 for r in rows if r["status"] == "Needs restock")
+    errors = sum(1 for r in rows if r["status"] == "Error")
+    st.caption(f"{flagged} of {len(rows)} shelves need restocking" + (f" • {errors} failed" if errors else ""))
+    st.download_button(
+        "Download table (JSON)",
+        data=json.dumps(rows, indent=2),
+        file_name="shelfscout_batch.json",
+        mime="application/json",
+    )
+
+
 def main() -> None:
     st.set_page_config(page_title="ShelfScout • CNN Analyzer", page_icon="🧠", layout="wide")
     inject_css()
@@ -178,9 +398,25 @@ def main() -> None:
         )
         st.session_state["base_url"] = base_url
 
+        mode = st.radio("Mode", ["Single image", "Batch audit"], horizontal=True,
+                        index=1 if st.session_state.get("mode") == "Batch audit" else 0)
+        st.session_state["mode"] = mode
+        if mode == "Batch audit":
+            parallel = st.slider("Parallel requests", 1, MAX_PARALLEL, int(st.session_state.get("parallel", 4)),
+                                 help="Images in flight at once over a shared keep-alive connection pool.")
+            st.session_state["parallel"] = parallel
+
         include_masks = st.toggle("Include masks", value=st.session_state.get("include_masks", True))
         st.session_state["include_masks"] = include_masks
 
+        downscale = st.toggle(
+            "Downscale before upload",
+            value=st.session_state.get("downscale", True),
+            help="Resize to the model input size and re-encode (WebP/JPEG) before sending. "
+            "The server discards the extra pixels anyway; this mainly saves upload time on slow Wi-Fi.",
+        )
+        st.session_state["downscale"] = downscale
+
         threshold_pct = st.slider("Empty threshold (%)", 0, 100, int(st.session_state.get("threshold_pct", 35)))
         st.session_state["threshold_pct"] = threshold_pct
 
@@ -193,6 +429,7 @@ def main() -> None:
         with c2:
             if st.button("Clear results", use_container_width=True):
                 st.session_state.pop("result", None)
+                st.session_state.pop("batch_rows", None)
                 st.toast("Cleared")
 
         ok = st.session_state.get("health_ok")
@@ -204,6 +441,10 @@ def main() -> None:
         else:
             st.info(msg)
 
+    if st.session_state.get("mode") == "Batch audit":
+        render_batch(base_url, float(threshold_pct))
+        return
+
     left, right = st.columns([0.48, 0.52], gap="large")
 
     with left:
@@ -241,8 +482,12 @@ def main() -> None:
                     progress.progress(25, text="Uploading…")
                     time.sleep(0.08)
                     progress.progress(55, text="Running model…")
-                    mime_type = getattr(uploaded, "type", None) or ""
-                    result = call_predict(base_url, uploaded.getvalue(), uploaded.name, mime_type, include_masks)
+                    spec = call_input_spec(base_url) if st.session_state.get("downscale", True) else None
+                    file_bytes, filename, mime_type = prepare_upload(
+                        uploaded.getvalue(), uploaded.name, getattr(uploaded, "type", None) or "", spec
+                    )
+                    result = call_predict(base_url, file_bytes, filename, mime_type, include_masks)
+                    result.original_bytes = uploaded.size
                     progress.progress(85, text="Preparing results…")
                     time.sleep(0.08)
                     st.session_state["result"] = result
@@ -265,10 +510,20 @@ def main() -> None:
         empty_ratio = float(payload.get("empty_ratio") or 0.0)
         label, kind = classification_badge(empty_ratio, float(st.session_state.get("threshold_pct", 35)))
 
+        timing = dict(result.server_timing or [])
+        server_badge = f'<span class="ss-badge">🖥 server {timing["total"]:.0f} ms</span>' if "total" in timing else ""
+        upload_badge = ""
+        if result.upload_bytes is not None:
+            upload_text = f"⬆ {fmt_bytes(result.upload_bytes)}"
+            if result.original_bytes and result.original_bytes != result.upload_bytes:
+                upload_text += f" (from {fmt_bytes(result.original_bytes)})"
+            upload_badge = f'<span class="ss-badge">{upload_text}</span>'
         st.markdown(
             f'<div style="display:flex; gap:10px; flex-wrap:wrap; margin-bottom:12px">'
             f'<span class="ss-badge {kind}">{label}</span>'
             f'<span class="ss-badge">⏱ {result.elapsed_ms} ms</span>'
+            f'{server_badge}'
+            f'{upload_badge}'
             f'</div>',
             unsafe_allow_html=True,
         )
@@ -300,6 +555,18 @@ def main() -> None:
                         fm = "×".join(map(str, fm))
                     st.metric("Feature map", fm)
 
+            stages = [(name, ms) for name, ms in (result.server_timing or []) if name != "total"]
+            if stages:
+                st.markdown("#### Server-side timing")
+                st.caption("Per-stage breakdown reported by the backend (Server-Timing header).")
+                st.dataframe(
+                    [{"stage": name, "ms": round(ms, 1)} for name, ms in stages],
+                    hide_index=True,
+                    use_container_width=True,
+                )
+                if "total" in timing:
+                    st.caption(f"Server total {timing['total']:.1f} ms • network/client overhead ~{max(0.0, result.elapsed_ms - timing['total']):.0f} ms")
+
             with st.expander("Raw JSON (optional)", expanded=False):
                 st.code(json.dumps(payload, indent=2), language="json")
 
@@ -347,6 +614,7 @@ def main() -> None:
             },
             "ui": {
                 "include_masks": st.session_state.get("include_masks", True),
+                "downscale": st.session_state.get("downscale", True),
                 "threshold_pct": st.session_state.get("threshold_pct", 35),
             },
         }